@@ -2,12 +2,14 @@
 # تشغيل محلي + إشعار للمدير عند بدء التشغيل
 
 import os
+import re
+import html
 import asyncio
 import urllib.parse
 from datetime import datetime
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart, Command, StateFilter
+from aiogram.filters import CommandStart, Command, CommandObject, StateFilter
 from aiogram.types import (
     Message,
     ReplyKeyboardMarkup, KeyboardButton,
@@ -16,6 +18,7 @@ from aiogram.types import (
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from dotenv import load_dotenv
 
@@ -27,6 +30,24 @@ ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
 if not BOT_TOKEN:
     raise RuntimeError("❌ BOT_TOKEN مفقود في ملف .env")
 
+# تخزين حالات المحادثة: sqlite (افتراضي، يبقى بعد إعادة التشغيل) أو memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", "data/fsm.sqlite3")
+FSM_TTL = float(os.getenv("FSM_TTL", str(7 * 24 * 3600)))  # حذف الجلسات الخاملة بعد أسبوع
+FSM_HOT_CACHE = int(os.getenv("FSM_HOT_CACHE", "1024"))
+# قاعدة طلبات التتبّع (تُعبّأ أول مرة من ORDERS بالأسفل)
+ORDERS_DB_PATH = os.getenv("ORDERS_DB_PATH", "data/orders.sqlite3")
+ORDERS_CACHE_SIZE = int(os.getenv("ORDERS_CACHE_SIZE", "4096"))
+# سجل طلبات عرض السعر (JSONL مع تدوير وفهرس) وملخّص إشعارات المدير
+QUOTE_JOURNAL_PATH = os.getenv("QUOTE_JOURNAL_PATH", "data/quote_requests.jsonl")
+QUOTE_JOURNAL_MAX_MB = int(os.getenv("QUOTE_JOURNAL_MAX_MB", "10"))
+QUOTE_DIGEST_SECONDS = float(os.getenv("QUOTE_DIGEST_SECONDS", "300"))
+# وضع polling: sharded (معالجة متوازية مع ترتيب داخل كل محادثة) أو default (dp.start_polling)
+POLLING_MODE = os.getenv("POLLING_MODE", "sharded").strip().lower()
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))  # أقصى عدد تحديثات قيد المعالجة معًا
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_MAX_PER_CHAT = int(os.getenv("UPDATE_MAX_PER_CHAT", "50"))
+
 # ========= بيانات المتجر =========
 STORE_NAME = "إعمار البيوت للسيراميك والمواد الصحية — سبها"
 WHATSAPP_INTL = "218915190151"
@@ -45,20 +66,37 @@ OFFERS = [
     "أسعار مميزة على بلاط 60×60 (لامع/مطفأ).",
     "خصومات على لواصق البلاط (كولا) للطلبات بالجملة."
 ]
+# بيانات أولية فقط: الطلبات الفعلية في ORDERS_DB_PATH (/order_set و /orders_import)
 ORDERS = {
     "EB-2510-001": {"status": "قيد التجهيز", "eta": "خلال 48 ساعة", "note": "بانتظار تأكيد القياسات."},
     "EB-2510-002": {"status": "تم التسليم", "eta": "-", "note": "سُلّم يوم 24/10/2025."},
 }
 
+from services.order_store import OrderStore, normalize_order_code, parse_orders
+order_store = OrderStore(ORDERS_DB_PATH, cache_size=ORDERS_CACHE_SIZE)
+order_store.seed(ORDERS)
+
 # ========= تهيئة البوت والـ Dispatcher =========
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+if FSM_STORAGE == "sqlite":
+    from services.fsm_storage import SQLiteStorage
+    storage = SQLiteStorage(FSM_DB_PATH, ttl=FSM_TTL, hot_size=FSM_HOT_CACHE)
+else:
+    storage = MemoryStorage()
+dp = Dispatcher(storage=storage)
+# قراءة بيانات FSM مرة واحدة لكل تحديث وكتابتها مرة واحدة في نهايته
+from services.fsm_cache import FSMUnitOfWorkMiddleware
+dp.update.outer_middleware(FSMUnitOfWorkMiddleware())
 
 # استيراد الراوترات
 from handlers.tile_calculator import router as tile_calc_router, start_calc as tile_start_calc
 dp.include_router(tile_calc_router)
 from handlers.offers_60 import router as offers60_router
 dp.include_router(offers60_router)
+from handlers.offers_search import router as offers_search_router
+dp.include_router(offers_search_router)
+from handlers.broadcast import router as broadcast_router, subscribers, start_broadcast
+dp.include_router(broadcast_router)
 router = Router()
 dp.include_router(router)
 
@@ -122,11 +160,41 @@ def make_whatsapp_prefill(data: dict) -> str:
     ]
     return f"https://wa.me/{WHATSAPP_INTL}?text=" + urllib.parse.quote("\n".join(lines))
 
+# خطوات النموذج بالترتيب: (الحالة، الحقل، السؤال)
+QUOTE_STEPS = [
+    (QuoteForm.product, "product", "🧾 ما المنتج أو المجموعة المطلوبة؟\nمثال: بلاط 60×60 لامع، طقم حمّام، كولا"),
+    (QuoteForm.area, "area", "📐 ما المساحة أو المكان؟\nمثال: صالة 40 م²، حمّام"),
+    (QuoteForm.quantity, "quantity", "🔢 الكمية التقريبية؟ (م² أو عدد القطع)"),
+    (QuoteForm.specs, "specs", "🎨 المواصفات: القياس/اللون/الماركة (أو - للتخطي)"),
+    (QuoteForm.customer, "customer", "👤 الاسم الكريم؟"),
+    (QuoteForm.phone, "phone", "📞 رقم الهاتف؟ مثال: 0915xxxxxx"),
+    (QuoteForm.address, "address", "📍 العنوان داخل سبها؟"),
+    (QuoteForm.notes, "notes", "📝 ملاحظات إضافية؟ (أو - للتخطي)"),
+]
+QUOTE_NEXT = {step[0].state: i for i, step in enumerate(QUOTE_STEPS)}
+_ASCII_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+def normalize_phone(text: str):
+    """أرقام فقط (مع + في البداية إن وُجدت)، أو None إذا لم يكن رقم هاتف معقولًا."""
+    raw = (text or "").translate(_ASCII_DIGITS).strip()
+    digits = "".join(ch for ch in raw if ch.isdigit())
+    if not 9 <= len(digits) <= 15:
+        return None
+    return ("+" if raw.startswith("+") else "") + digits
+
+from services.journal import JsonlJournal
+from services.digest import DigestNotifier
+quote_journal = JsonlJournal(QUOTE_JOURNAL_PATH, index_fields=("date", "phone"),
+                             max_bytes=QUOTE_JOURNAL_MAX_MB * 1024 * 1024)
+
 # ========= أوامر و ردود =========
+# الهاندلرز التي ترسل ردًا واحدًا فقط تُرجع الطلب (return msg.answer(...)) بدل await،
+# فيُرسل داخل رد الويبهوك نفسه دون طلب HTTPS إضافي (وفي polling يُنفّذ تلقائيًا).
 @router.message(CommandStart())
 async def start_cmd(msg: Message, state: FSMContext):
     await state.clear()
-    await msg.answer(WELCOME_TEXT, reply_markup=main_kb)
+    subscribers.add(msg.chat.id)  # مشترك في بث العروض
+    return msg.answer(WELCOME_TEXT, reply_markup=main_kb)
 
 @router.message(F.text == "🧮 حاسبة السيراميك")
 async def open_calculator_from_home(msg: Message, state: FSMContext):
@@ -134,7 +202,7 @@ async def open_calculator_from_home(msg: Message, state: FSMContext):
 
 @router.message(Command("help"))
 async def help_cmd(msg: Message):
-    await msg.answer(
+    return msg.answer(
         "✨ ماذا أفعل؟\n"
         "• 🧮 حاسبة السيراميك: من زر الواجهة أو /tile\n"
         "• 🧾 طلب عرض سعر: نموذج سريع.\n"
@@ -146,24 +214,106 @@ async def help_cmd(msg: Message):
 
 @router.message(F.text == "ℹ️ معلومات")
 async def info_cmd(msg: Message):
-    await msg.answer(INFO_TEXT, reply_markup=inline_links())
+    return msg.answer(INFO_TEXT, reply_markup=inline_links())
 
 @router.message(F.text == "🕘 أوقات العمل")
 async def hours_cmd(msg: Message):
-    await msg.answer(WORKING_HOURS)
+    return msg.answer(WORKING_HOURS)
 
 @router.message(F.text == "📍 الموقع")
 async def location_cmd(msg: Message):
-    await msg.answer(f"الموقع على الخريطة:\n{GOOGLE_MAPS_LINK}", reply_markup=inline_links())
+    return msg.answer(f"الموقع على الخريطة:\n{GOOGLE_MAPS_LINK}", reply_markup=inline_links())
 
 @router.message(F.text == "📞 واتساب مباشر")
 async def contact_cmd(msg: Message):
-    await msg.answer(f"تواصل عبر واتساب:\n{WHATSAPP_LINK}", reply_markup=inline_links())
+    return msg.answer(f"تواصل عبر واتساب:\n{WHATSAPP_LINK}", reply_markup=inline_links())
 
 @router.message(F.text == "📰 أحدث العروض")
 async def latest_offers(msg: Message):
     body = "📰 <b>أحدث عروضنا:</b>\n• " + "\n• ".join(OFFERS)
-    await msg.answer(body, reply_markup=inline_links())
+    return msg.answer(body, reply_markup=inline_links())
+
+# ========= طلب عرض سعر =========
+@router.message(F.text == "🧾 طلب عرض سعر")
+async def quote_start(msg: Message, state: FSMContext):
+    await state.clear()
+    await state.set_state(QUOTE_STEPS[0][0])
+    return msg.answer(QUOTE_STEPS[0][2] + "\n\n(للإلغاء أرسل: إلغاء)")
+
+@router.message(StateFilter(QuoteForm), F.text.in_({"إلغاء", "/cancel"}))
+async def quote_cancel(msg: Message, state: FSMContext):
+    await state.clear()
+    return msg.answer("تم إلغاء الطلب.", reply_markup=main_kb)
+
+@router.message(StateFilter(QuoteForm), F.text)
+async def quote_step(msg: Message, state: FSMContext):
+    i = QUOTE_NEXT[await state.get_state()]
+    _, field, _ = QUOTE_STEPS[i]
+    value = msg.text.strip()
+    if field == "phone":
+        value = normalize_phone(value)
+        if not value:
+            return msg.answer("⚠️ رقم غير صحيح. أرسل رقم الهاتف بالأرقام فقط، مثال: 0915xxxxxx")
+    elif value == "-" and field in {"specs", "notes"}:
+        value = ""
+    await state.update_data(**{field: value[:500]})
+    if i + 1 < len(QUOTE_STEPS):
+        await state.set_state(QUOTE_STEPS[i + 1][0])
+        return msg.answer(QUOTE_STEPS[i + 1][2])
+    data = await state.get_data()
+    await state.clear()
+    return await submit_quote(msg, data)
+
+async def submit_quote(msg: Message, data: dict):
+    now = datetime.now()
+    record = {field: data.get(field, "") for _, field, _ in QUOTE_STEPS}
+    record.update(
+        ts=now.isoformat(timespec="seconds"), date=now.strftime("%Y-%m-%d"),
+        chat_id=msg.chat.id, user_id=msg.from_user.id if msg.from_user else None,
+        username=msg.from_user.username if msg.from_user else None,
+    )
+    quote_journal.append(record)
+    if quote_digest is not None:
+        # نص خام: DigestNotifier يهرّبه بعد القص
+        quote_digest.add(
+            f"👤 {record['customer']} — {record['phone']}\n"
+            f"🧾 {record['product']} | {record['area']} | {record['quantity']}\n"
+            f"📍 {record['address']}" + (f"\n📝 {record['notes']}" if record["notes"] else "")
+        )
+    kb = InlineKeyboardBuilder()
+    kb.button(text="📲 إرسال الطلب عبر واتساب", url=make_whatsapp_prefill(record))
+    return msg.answer(
+        "✅ تم استلام طلب عرض السعر، وسنتواصل معك قريبًا.\n"
+        "لتسريع الرد يمكنك إرساله أيضًا عبر واتساب:",
+        reply_markup=kb.as_markup()
+    )
+
+@router.message(Command("quotes"))
+async def quotes_lookup(msg: Message, command: CommandObject):
+    """/quotes 2026-10-17 أو /quotes 0915xxxxxx — أحدث طلبات عرض السعر."""
+    if not is_admin(msg):
+        return msg.answer("❌ هذا الأمر للمدير فقط.")
+    arg = (command.args or datetime.now().strftime("%Y-%m-%d")).strip()
+    phone = normalize_phone(arg)
+    field, value = ("date", arg) if re.fullmatch(r"\d{4}-\d{2}-\d{2}", arg) or not phone else ("phone", phone)
+    records = await quote_journal.find(field, value, limit=20)
+    if not records:
+        return msg.answer(f"لا توجد طلبات لـ {html.escape(value)}.")
+    lines = [f"🧾 طلبات {html.escape(value)} ({len(records)}):"]
+    for r in records:
+        lines.append(html.escape(
+            f"• {r.get('ts', '')} — {r.get('customer', '')} {r.get('phone', '')}: "
+            f"{r.get('product', '')} | {r.get('quantity', '')}"
+        ))
+    return msg.answer("\n".join(lines)[:4096])
+
+@router.message(Command("broadcast_latest"))
+async def broadcast_latest(msg: Message, bot: Bot):
+    """بث قائمة «أحدث العروض» (OFFERS) لكل المشتركين."""
+    if not is_admin(msg):
+        return msg.answer("❌ هذا الأمر للمدير فقط.")
+    body = "📰 <b>أحدث عروضنا:</b>\n• " + "\n• ".join(OFFERS)
+    await start_broadcast(msg, bot, {"text": body})
 
 # ========= تتبّع الطلب =========
 class TrackForm(StatesGroup):
@@ -172,23 +322,70 @@ class TrackForm(StatesGroup):
 @router.message(F.text == "📦 تتبّع الطلب")
 async def ask_order_code(msg: Message, state: FSMContext):
     await state.set_state(TrackForm.code)
-    await msg.answer("أرسل رقم الطلب بصيغة: <code>EB-YYMM-###</code>\nمثال: <code>EB-2510-001</code>")
+    return msg.answer("أرسل رقم الطلب بصيغة: <code>EB-YYMM-###</code>\nمثال: <code>EB-2510-001</code>")
 
 @router.message(TrackForm.code)
 async def track_order(msg: Message, state: FSMContext):
-    code = msg.text.strip()
-    order = ORDERS.get(code)
+    code = normalize_order_code(msg.text or "")
+    order = order_store.get(code)
     if order:
         reply = (
-            f"نتيجة التتبع <b>{code}</b>:\n"
-            f"• الحالة: {order['status']}\n"
-            f"• الزمن المتوقع: {order['eta']}\n"
-            f"• ملاحظة: {order['note']}"
+            f"نتيجة التتبع <b>{html.escape(code)}</b>:\n"
+            f"• الحالة: {html.escape(order['status'])}\n"
+            f"• الزمن المتوقع: {html.escape(order['eta'])}\n"
+            f"• ملاحظة: {html.escape(order['note'])}"
         )
     else:
         reply = "عذرًا، لم نعثر على هذا الرقم.\nتواصل عبر واتساب مع ذكر الاسم ورقم الطلب:\n" + WHATSAPP_LINK
     await state.clear()
-    await msg.answer(reply, reply_markup=inline_links())
+    return msg.answer(reply, reply_markup=inline_links())
+
+# ========= إدارة الطلبات (للمدير) =========
+def is_admin(msg: Message) -> bool:
+    return bool(ADMIN_CHAT_ID) and ADMIN_CHAT_ID != "0" and str(msg.chat.id) == str(ADMIN_CHAT_ID)
+
+@router.message(Command("order_set"))
+async def order_set_cmd(msg: Message, command: CommandObject):
+    """/order_set EB-2510-003 | الحالة | الزمن المتوقع | ملاحظة"""
+    if not is_admin(msg):
+        return msg.answer("❌ هذا الأمر للمدير فقط.")
+    parts = [p.strip() for p in (command.args or "").split("|")]
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        return msg.answer(
+            "الصيغة:\n<code>/order_set EB-2510-003 | الحالة | الزمن المتوقع | ملاحظة</code>\n"
+            "(الزمن والملاحظة اختياريان)"
+        )
+    parts += ["", ""]
+    code = order_store.upsert(parts[0], parts[1], parts[2] or "-", parts[3])
+    return msg.answer(f"✅ تم حفظ الطلب <b>{html.escape(code)}</b>: {html.escape(parts[1])}")
+
+@router.message(Command("orders_import"))
+async def orders_import_cmd(msg: Message, bot: Bot):
+    """أرسل ملف CSV أو JSONL مع الأمر كتعليق، أو ردّ على الملف بالأمر."""
+    if not is_admin(msg):
+        return msg.answer("❌ هذا الأمر للمدير فقط.")
+    doc = msg.document or (msg.reply_to_message.document if msg.reply_to_message else None)
+    if not doc:
+        return msg.answer(
+            "أرسل ملف <code>.csv</code> (ترويسة code,status,eta,note) أو <code>.jsonl</code> "
+            "مع الأمر /orders_import كتعليق، أو ردّ على الملف بالأمر."
+        )
+    name = (doc.file_name or "").lower()
+    fmt = "csv" if name.endswith(".csv") else "jsonl" if name.endswith((".jsonl", ".json")) else None
+    if not fmt:
+        return msg.answer("⚠️ الصيغ المدعومة: .csv أو .jsonl")
+    buf = await bot.download(doc)
+    text = buf.read().decode("utf-8", errors="replace")
+    orders, errors = parse_orders(text, fmt)
+    try:
+        written = await asyncio.to_thread(order_store.upsert_many, orders)
+    except Exception as e:
+        # الدفعة معاملة واحدة: لم يُكتب منها شيء
+        return msg.answer(f"⚠️ فشل الاستيراد ولم يُكتب أي طلب: {html.escape(str(e))}")
+    report = f"📥 تم استيراد {written} طلب (الإجمالي الآن {order_store.count()})."
+    if errors:
+        report += f"\n⚠️ أسطر مرفوضة: {len(errors)}\n" + html.escape("\n".join(errors[:10]))
+    return msg.answer(report)
 
 # ========= إشعار المدير عند بدء التشغيل =========
 async def notify_admin():
@@ -199,11 +396,39 @@ async def notify_admin():
     except Exception as e:
         print(f"⚠️ فشل إرسال الإشعار: {e}")
 
+# ملخّص طلبات عرض السعر للمدير كل QUOTE_DIGEST_SECONDS بدل رسالة لكل طلب
+async def _send_to_admin(text: str):
+    await bot.send_message(ADMIN_CHAT_ID, text)
+
+quote_digest = (
+    DigestNotifier(_send_to_admin, "🧾 طلبات عرض سعر جديدة", interval=QUOTE_DIGEST_SECONDS)
+    if ADMIN_CHAT_ID and ADMIN_CHAT_ID != "0" else None
+)
+
+@dp.startup()
+async def on_startup():
+    await quote_journal.start()
+    if quote_digest is not None:
+        quote_digest.start()
+
+@dp.shutdown()
+async def on_shutdown():
+    if quote_digest is not None:
+        await quote_digest.stop()
+    await quote_journal.stop()
+
 # ========= التشغيل =========
 async def main():
     print("✅ البوت بدأ التشغيل... الرجاء الانتظار")
     await notify_admin()
-    await dp.start_polling(bot)
+    if POLLING_MODE == "sharded":
+        from services.polling import make_update_handler, run_sharded_polling
+        from services.update_queue import UpdateQueue
+        queue = UpdateQueue(make_update_handler(dp, bot), workers=UPDATE_WORKERS,
+                            maxsize=UPDATE_QUEUE_SIZE, max_per_chat=UPDATE_MAX_PER_CHAT)
+        await run_sharded_polling(dp, bot, queue)
+    else:
+        await dp.start_polling(bot)
     print("✅ Bot started and ready!")
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+# handlers/broadcast.py
+# بث العروض للمشتركين (أوامر المدير) — التسجيل يتم من /start في bot.py
+import os
+import asyncio
+import html
+from typing import Any, Dict, List, Optional
+
+from aiogram import Router, Bot
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from services.broadcast import Broadcaster, SubscriberRegistry
+from services.fileio import FileLock
+from services.uploader import ProgressMessage
+from services.price_catalog import price_catalog
+from handlers.offers_60 import catalog as offers_catalog
+
+router = Router(name="broadcast_router")
+
+# ===== إعدادات عامة =====
+ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
+BROADCAST_DB_PATH = os.getenv("BROADCAST_DB_PATH", "data/broadcast.sqlite3")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # رسالة/ث (حد تيليجرام العام ~30)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_BATCH = int(os.getenv("BROADCAST_BATCH", "250"))  # حفظ التقدّم بعد كل دفعة
+BROADCAST_LOCK = os.getenv("BROADCAST_LOCK", "data/broadcast.lock")  # بث واحد بين كل العمليات
+
+subscribers = SubscriberRegistry(BROADCAST_DB_PATH)
+_broadcaster: Optional[Broadcaster] = None
+_task: Optional[asyncio.Task] = None
+_lock: Optional[FileLock] = None
+
+def is_admin(msg: Message) -> bool:
+    return bool(ADMIN_CHAT_ID) and ADMIN_CHAT_ID != "0" and str(msg.chat.id) == str(ADMIN_CHAT_ID)
+
+def get_broadcaster(bot: Bot) -> Broadcaster:
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = Broadcaster(bot, subscribers, rate=BROADCAST_RATE,
+                                   concurrency=BROADCAST_CONCURRENCY, batch_size=BROADCAST_BATCH)
+    return _broadcaster
+
+def status_text(b: Dict[str, Any]) -> str:
+    state = {"running": "⏳ جارٍ", "done": "✅ اكتمل", "cancelled": "⛔️ أُلغي"}.get(b.get("status"), b.get("status"))
+    return (
+        f"📣 بث #{b['id']} — {state}\n"
+        f"أُرسل: {b['sent']} / {b['total']}\n"
+        f"فشل: {b['failed']} | حُذف (حظر البوت): {b['removed']}"
+    )
+
+# ===== التشغيل في الخلفية =====
+async def claim() -> bool:
+    """حجز البث لهذه العملية (FileLock) حتى لا يرسل عمّالان نفس البث مرتين."""
+    global _lock
+    if _lock is not None:
+        return True
+    lock = FileLock(BROADCAST_LOCK)
+    if not await asyncio.to_thread(lock.acquire):
+        return False
+    _lock = lock
+    return True
+
+def release() -> None:
+    global _lock
+    if _lock is not None:
+        _lock.release()
+        _lock = None
+
+async def run_broadcast(bot: Bot, broadcast_id: int, progress_msg: Optional[Message] = None) -> None:
+    progress = ProgressMessage(progress_msg, interval=5.0) if progress_msg else None
+
+    async def on_progress(b: Dict[str, Any]) -> None:
+        if progress:
+            try:
+                await progress.update(status_text(b))
+            except Exception:
+                pass  # تعذّر تعديل رسالة التقدّم لا يوقف البث
+
+    try:
+        result = await get_broadcaster(bot).run(broadcast_id, on_progress)
+    except Exception as e:
+        print(f"⚠️ broadcast #{broadcast_id}: توقف بخطأ ({e}) — يُستأنف عند التشغيل التالي")
+        return
+    if result and result.get("admin_chat"):
+        try:
+            await bot.send_message(result["admin_chat"], status_text(result))
+        except Exception as e:
+            print(f"⚠️ broadcast: تعذّر إرسال التقرير: {e}")
+
+def launch(bot: Bot, broadcast_ids: List[int], progress_msg: Optional[Message] = None) -> None:
+    """تشغيل البثوث بالترتيب كمهمة خلفية حتى لا ينتظر الهاندلر (أو الويبهوك) انتهاءها.
+    يجب حجز القفل (claim) قبل الاستدعاء؛ يُحرَّر عند انتهاء المهمة."""
+    global _task
+
+    async def run() -> None:
+        try:
+            for broadcast_id in broadcast_ids:
+                await run_broadcast(bot, broadcast_id, progress_msg)
+        finally:
+            release()
+
+    _task = asyncio.create_task(run())
+
+async def start_broadcast(msg: Message, bot: Bot, payload: Dict[str, Any]):
+    if _task is not None and not _task.done():
+        return await msg.answer("⚠️ يوجد بث جارٍ. استخدم /broadcast_status أو /broadcast_cancel.")
+    total = subscribers.count()
+    if not total:
+        return await msg.answer("📭 لا يوجد مشتركون بعد.")
+    if not await claim():
+        return await msg.answer("⚠️ يوجد بث جارٍ في عملية أخرى. استخدم /broadcast_status.")
+    try:
+        broadcast_id = subscribers.create_broadcast(payload, msg.chat.id)
+        progress_msg = await msg.answer(f"📣 بدء البث #{broadcast_id} إلى {total} محادثة…")
+    except BaseException:
+        release()
+        raise
+    launch(bot, [broadcast_id], progress_msg)
+
+@router.startup()
+async def resume_broadcasts(bot: Bot):
+    """استئناف كل بث انقطع بإعادة التشغيل (بالترتيب) من آخر دفعة محفوظة."""
+    pending = subscribers.running()
+    if not pending:
+        return
+    if not await claim():
+        print("ℹ️ broadcast: عملية أخرى تملك البث — لا استئناف هنا")
+        return
+    print(f"↩️ استئناف البث: {', '.join(f'#{i}' for i in pending)}")
+    launch(bot, pending)
+
+@router.shutdown()
+async def stop_broadcasts():
+    # المؤشر محفوظ بعد كل دفعة؛ الحالة تبقى running فيُستأنف البث عند التشغيل التالي
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    release()
+
+# ===== أوامر المدير =====
+@router.message(Command("broadcast"))
+async def broadcast_cmd(msg: Message, bot: Bot, command: CommandObject):
+    """/broadcast نص الرسالة — أو ردّ على صورة بالأمر لبثها مع تعليقها."""
+    if not is_admin(msg):
+        return await msg.answer("❌ هذا الأمر للمدير فقط.")
+    reply = msg.reply_to_message
+    if reply and reply.photo:
+        caption = command.args or reply.caption or ""
+        return await start_broadcast(msg, bot, {"photo": reply.photo[-1].file_id, "caption": caption})
+    if not command.args:
+        return await msg.answer(
+            "الاستخدام:\n"
+            "• <code>/broadcast نص الرسالة</code>\n"
+            "• ردّ على صورة بـ /broadcast (مع نص اختياري)\n"
+            "• <code>/broadcast_offer CG6600001</code> لبث عرض 60×60"
+        )
+    await start_broadcast(msg, bot, {"text": command.args})
+
+@router.message(Command("broadcast_offer"))
+async def broadcast_offer_cmd(msg: Message, bot: Bot, command: CommandObject):
+    """بث عرض 60×60 مؤرشف بصورته ونصه (مع السعر)."""
+    if not is_admin(msg):
+        return await msg.answer("❌ هذا الأمر للمدير فقط.")
+    cat = offers_catalog.refresh()
+    code = (command.args or "").strip().upper()
+    if code not in cat.index:
+        return await msg.answer(f"❌ العرض غير مؤرشف: <code>{html.escape(code or '-')}</code>")
+    product = price_catalog.get(code)
+    caption = (
+        f"🆕 عرض جديد: <b>{code}</b> — 60×60\n"
+        + (f"💰 السعر: {product.price:g} د.ل / {product.unit}\n" if product else "")
+        + "💬 اطلبه بذكر رقم العرض."
+    )
+    await start_broadcast(msg, bot, {"photo": cat.items[cat.index[code]][1], "caption": caption})
+
+@router.message(Command("broadcast_status"))
+async def broadcast_status_cmd(msg: Message):
+    if not is_admin(msg):
+        return await msg.answer("❌ هذا الأمر للمدير فقط.")
+    b = subscribers.latest()
+    if not b:
+        return await msg.answer(f"لا يوجد بث سابق. المشتركون: {subscribers.count()}")
+    await msg.answer(status_text(b) + f"\nالمشتركون النشطون: {subscribers.count()}")
+
+@router.message(Command("broadcast_cancel"))
+async def broadcast_cancel_cmd(msg: Message):
+    if not is_admin(msg):
+        return await msg.answer("❌ هذا الأمر للمدير فقط.")
+    if _broadcaster is None or not _broadcaster.cancel():
+        return await msg.answer("لا يوجد بث جارٍ.")
+    await msg.answer("⛔️ سيتوقف البث بعد الرسائل الجارية.")
@@ -1,14 +1,29 @@
 # handlers/offers_60.py
 # عروض صور 60×60 — أرشفة (رفع مرة واحدة) + عرض مع أزرار تنقّل
-import os, json, asyncio
-from typing import Dict, List, Tuple
+import os, json, time, asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set, Tuple
 
 from aiogram import Router, F, Bot
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import (
     Message, CallbackQuery,
     InlineKeyboardMarkup, InlineKeyboardButton,
-    FSInputFile, InputMediaPhoto
+    InputMediaPhoto, BufferedInputFile
+)
+
+from aiogram.exceptions import TelegramBadRequest
+
+from services.offers_catalog import OffersCatalog
+from services.debounce import Debouncer
+from services import contact_sheet
+from services.contact_sheet import SheetCache, render_contact_sheet, sheet_key
+from services.price_catalog import price_catalog
+from services.fileio import FileLock, atomic_write_json
+from services.file_check import BrokenFileIds, verify_file_ids
+from services.uploader import AdaptiveRateLimiter, ProgressMessage, upload_photos
+from services.image_manifest import (
+    IMAGE_EXTS, load_manifest, save_manifest, scan_images, plan_changes, build_manifest,
 )
 
 router = Router(name="offers_60_router")
@@ -16,33 +31,218 @@ router = Router(name="offers_60_router")
 # ===== إعدادات عامة =====
 IMAGES_DIR = "images/60x60"
 OFFERS_JSON = "offers_60x60.json"
+MANIFEST_JSON = "offers_60x60.manifest.json"  # حجم/mtime/بصمة كل صورة بجانب file_id
+CHECKPOINT_JSON = "offers_60x60.checkpoint.json"  # تقدّم أرشفة لم تكتمل (للاستئناف)
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")  # تأكد من ضبطه في .env
+OFFERS_RELOAD_INTERVAL = float(os.getenv("OFFERS_RELOAD_INTERVAL", "30"))  # ثوانٍ بين فحوص mtime
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_MAX_RATE = float(os.getenv("UPLOAD_MAX_RATE", "10"))  # أقصى عدد صور في الثانية
+CHECKPOINT_EVERY = int(os.getenv("INDEX_CHECKPOINT_EVERY", "10"))  # حفظ بعد كل N صور مرفوعة
+CHECKPOINT_SECONDS = float(os.getenv("INDEX_CHECKPOINT_SECONDS", "15"))  # أو كل N ثانية
+NAV_DEBOUNCE = float(os.getenv("OFFERS_NAV_DEBOUNCE", "0.25"))  # ثوانٍ لدمج ضغطات التنقل السريعة
+# وضع الصفحات: ألبوم (حتى 10 صور في رسالة واحدة) أو شبكة معاينة مولّدة مرة واحدة
+ALBUM_SIZE = 10  # أقصى عدد عناصر في send_media_group
+GRID_PAGE = int(os.getenv("OFFERS_GRID_PAGE", "20"))
+GRID_COLS = int(os.getenv("OFFERS_GRID_COLS", "5"))
+GRID_THUMB = int(os.getenv("OFFERS_GRID_THUMB", "240"))
+SHEETS_JSON = "offers_60x60.sheets.json"  # بصمة صفحة الشبكة → file_id
+BROKEN_JSON = "offers_60x60.broken.json"  # code → file_id رفضه تيليجرام (لا يُعرض حتى تُعاد أرشفته)
+FONT_PATH = os.path.join("fonts", "Amiri-Regular.ttf")
+# فحص دوري لصلاحية file_id وإعادة رفع التالف فقط (0 = معطّل)
+VERIFY_INTERVAL = float(os.getenv("FILEID_VERIFY_INTERVAL", str(6 * 3600)))
+VERIFY_FIRST_DELAY = float(os.getenv("FILEID_VERIFY_FIRST_DELAY", "300"))  # أول فحص بعد التشغيل
+VERIFY_CONCURRENCY = int(os.getenv("FILEID_VERIFY_CONCURRENCY", "4"))
+VERIFY_RATE = float(os.getenv("FILEID_VERIFY_RATE", "5"))  # أقصى getFile في الثانية
+# قفل بين العمليات لكل من يكتب الخريطة والبيان (الأرشفة + الفاحص)
+ARCHIVE_LOCK = os.getenv("OFFERS_ARCHIVE_LOCK", "data/offers_60x60.lock")
 
 # ===== دوال مساعدة =====
 def save_map(d: Dict[str, str]) -> None:
-    """حفظ قائمة الصور المؤرشفة (رقم العرض → file_id)."""
-    with open(OFFERS_JSON, "w", encoding="utf-8") as f:
-        json.dump(d, f, ensure_ascii=False, indent=2)
+    """حفظ قائمة الصور المؤرشفة (رقم العرض → file_id) بكتابة ذرّية."""
+    atomic_write_json(OFFERS_JSON, d, indent=2)
+    catalog.reload()
+    broken_ids.prune(d)
 
 def load_items() -> List[Tuple[str, str]]:
-    """تحميل قائمة الصور المؤرشفة من ملف JSON."""
-    if os.path.exists(OFFERS_JSON):
-        with open(OFFERS_JSON, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return sorted(data.items(), key=lambda kv: kv[0])
-    return []
+    """قائمة الصور المؤرشفة (من الكتالوج في الذاكرة، دون قراءة الملف في كل مرة)."""
+    return catalog.refresh().items
+
+def offer_caption(code: str, idx: int, total: int) -> str:
+    product = price_catalog.get(code)
+    price = f"💰 السعر: {product.price:g} د.ل / {product.unit}\n" if product else ""
+    return (
+        f"🧱 عرض <b>{code}</b> — 60×60\n"
+        f"({idx+1} من {total})\n"
+        f"{price}"
+        f"💬 اطلبه بذكر رقم العرض."
+    )
+
+def unavailable_caption(code: str, idx: int, total: int) -> str:
+    return (
+        f"🧱 عرض <b>{code}</b> — 60×60\n"
+        f"({idx+1} من {total})\n"
+        f"🛠️ الصورة قيد التحديث.\n"
+        f"💬 اطلبه بذكر رقم العرض."
+    )
 
 def nav_kb(idx: int, total: int) -> InlineKeyboardMarkup:
-    """إنشاء أزرار التنقل (التالي / السابق / رجوع)."""
-    prev_btn = InlineKeyboardButton(text="⬅️ السابق", callback_data=f"offer60:{max(0, idx-1)}")
-    next_btn = InlineKeyboardButton(text="التالي ➡️", callback_data=f"offer60:{min(total-1, idx+1)}")
+    """إنشاء أزرار التنقل (التالي / السابق / رجوع).
+    الأزرار نسبية (p/n مع الفهرس المعروض) فتتراكم الضغطات السريعة قبل تحديث الرسالة."""
+    prev_btn = InlineKeyboardButton(text="⬅️ السابق", callback_data=f"offer60:p:{idx}")
+    next_btn = InlineKeyboardButton(text="التالي ➡️", callback_data=f"offer60:n:{idx}")
     back_btn = InlineKeyboardButton(text="🔙 رجوع", callback_data="offer60:back")
-    return InlineKeyboardMarkup(inline_keyboard=[[prev_btn, next_btn], [back_btn]])
+    return InlineKeyboardMarkup(inline_keyboard=[[prev_btn, next_btn], pages_row(), [back_btn]])
+
+def pages_row() -> List[InlineKeyboardButton]:
+    row = [InlineKeyboardButton(text="🗂️ ألبوم", callback_data="offer60pg:a:0")]
+    if contact_sheet.available():
+        row.append(InlineKeyboardButton(text="🔲 شبكة", callback_data="offer60pg:g:0"))
+    return row
+
+def page_kb(kind: str, page: int, pages: int) -> InlineKeyboardMarkup:
+    nav_row = []
+    if page > 0:
+        nav_row.append(InlineKeyboardButton(text="⬅️ السابق", callback_data=f"offer60pg:{kind}:{page-1}"))
+    if page < pages - 1:
+        nav_row.append(InlineKeyboardButton(text="التالي ➡️", callback_data=f"offer60pg:{kind}:{page+1}"))
+    rows = [nav_row] if nav_row else []
+    if kind == "g":
+        rows.append([InlineKeyboardButton(text="🗂️ ألبوم", callback_data=f"offer60pg:a:{page * GRID_PAGE // ALBUM_SIZE}")])
+    elif contact_sheet.available():
+        rows.append([InlineKeyboardButton(text="🔲 شبكة", callback_data=f"offer60pg:g:{page * ALBUM_SIZE // GRID_PAGE}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def _render_offer(idx: int, code: str, total: int):
+    return offer_caption(code, idx, total), nav_kb(idx, total)
+
+# كتالوج واحد للعملية كلها: قائمة مرتبة + فهرس code→idx + نصوص وأزرار جاهزة
+# stamp: تغيّر إصدار الأسعار يعيد صياغة النصوص دون إعادة قراءة ملف العروض
+catalog = OffersCatalog(OFFERS_JSON, _render_offer, check_interval=OFFERS_RELOAD_INTERVAL,
+                        stamp=lambda: price_catalog.refresh().version)
+broken_ids = BrokenFileIds(BROKEN_JSON)
+
+def visible(items: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """العناصر بدون المعرّفات المعلَّمة تالفة."""
+    return [(code, fid) for code, fid in items if not broken_ids.is_broken(code, fid)]
+
+def unavailable_note(chunk: List[Tuple[str, str]], shown: List[Tuple[str, str]]) -> str:
+    shown_codes = {code for code, _ in shown}
+    skipped = [code for code, _ in chunk if code not in shown_codes]
+    return f"\n🛠️ قيد التحديث: {', '.join(skipped)}" if skipped else ""
+
+class IndexCheckpoint:
+    """حفظ دوري (ذرّي) للخريطة والبيان أثناء الرفع، حتى لا يضيع ما رُفع عند انقطاع التشغيل.
+    ملف CHECKPOINT_JSON يسجل الأكواد المنجزة للأمر الجاري ويُحذف عند اكتماله."""
+
+    def __init__(self, command: str, current, manifest, base_map: Dict[str, str]):
+        self.command = command
+        self.current = current
+        self.manifest = manifest
+        self.base_map = base_map
+        self.uploaded: Dict[str, str] = {}
+        self.done: Set[str] = set()
+        self._saved = 0
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def resume(self) -> Set[str]:
+        """الأكواد التي أنجزها تشغيل سابق لنفس الأمر (إن وُجد)."""
+        try:
+            with open(CHECKPOINT_JSON, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if data.get("command") != self.command:
+            return set()
+        self.done = {c for c in data.get("done", []) if c in self.base_map}
+        return self.done
+
+    def _due(self) -> bool:
+        pending = len(self.uploaded) - self._saved
+        return pending >= CHECKPOINT_EVERY or (pending > 0 and time.monotonic() - self._last >= CHECKPOINT_SECONDS)
+
+    async def maybe_save(self) -> None:
+        if self._due():
+            async with self._lock:
+                if self._due():  # ربما حفظه عامل آخر أثناء الانتظار
+                    await self.save()
+
+    async def save(self) -> None:
+        uploaded = dict(self.uploaded)
+        partial = {**self.base_map, **uploaded}
+        manifest = build_manifest(self.current, self.manifest, partial, uploaded)
+        state = {"command": self.command, "done": sorted(self.done | set(uploaded))}
+
+        def write():
+            atomic_write_json(MANIFEST_JSON, manifest, indent=2, sort_keys=True)
+            atomic_write_json(OFFERS_JSON, partial, indent=2)
+            atomic_write_json(CHECKPOINT_JSON, state)
+
+        await asyncio.to_thread(write)
+        catalog.reload()
+        self._saved = len(uploaded)
+        self._last = time.monotonic()
+
+    def finish(self) -> None:
+        try:
+            os.remove(CHECKPOINT_JSON)
+        except OSError:
+            pass
+
+async def upload_with_progress(msg: Message, bot: Bot, jobs, title: str,
+                               checkpoint: Optional[IndexCheckpoint] = None):
+    """رفع متوازٍ بمعدل تكيّفي مع رسالة حالة واحدة تُحدَّث أثناء التقدم."""
+    status = await msg.answer(f"⏳ {title}… (0/{len(jobs)})")
+    progress = ProgressMessage(status)
+
+    async def on_progress(done: int, failed: int, total: int):
+        await progress.update(f"⏳ {title}… ({done + failed}/{total})\n✅ {done} | ⚠️ {failed}")
+        if checkpoint is not None:
+            await checkpoint.maybe_save()
+
+    limiter = AdaptiveRateLimiter(max_rate=UPLOAD_MAX_RATE)
+    result_map, fails = await upload_photos(
+        bot, msg.chat.id, jobs,
+        concurrency=UPLOAD_CONCURRENCY, limiter=limiter, on_progress=on_progress,
+        results=checkpoint.uploaded if checkpoint is not None else None,
+    )
+    await progress.update(f"☑️ {title}: انتهى ({len(result_map)}/{len(jobs)})", force=True)
+    return result_map, fails
+
+def fails_preview(fails) -> str:
+    # نعرض أول 10 أخطاء لتقليل الازدحام
+    preview_fails = "\n".join([f"- {c}: {err}" for c, err in fails[:10]])
+    more_f = f"\n… (+{len(fails)-10} حالات أخرى)" if len(fails) > 10 else ""
+    return preview_fails + more_f
+
+# ===== قفل الأرشفة =====
+# /index_60 و /index_60_missing والفاحص الدوري يبنون الخريطة من نسخة ويحفظونها في النهاية،
+# فتشغيلهم معًا يجعل آخر حافظ يمحو file_id الجديدة عند الآخر → واحد فقط في كل مرة.
+ARCHIVE_BUSY = "⏳ توجد أرشفة أو فحص جارٍ للصور، حاول بعد قليل."
+_archive_lock = asyncio.Lock()
+
+class ArchiveBusy(Exception):
+    pass
+
+@asynccontextmanager
+async def exclusive_archive():
+    """قفل داخل العملية (asyncio) وبين العمليات (FileLock)؛ يرفع ArchiveBusy دون انتظار."""
+    if _archive_lock.locked():
+        raise ArchiveBusy()
+    async with _archive_lock:
+        lock = FileLock(ARCHIVE_LOCK)
+        if not await asyncio.to_thread(lock.acquire):
+            raise ArchiveBusy()
+        try:
+            yield
+        finally:
+            lock.release()
 
 # ===== (1) أمر الأرشفة: /index_60 =====
 @router.message(Command("index_60"))
-async def index_60(msg: Message, bot: Bot):
-    """رفع الصور من المجلد واستخراج file_id لكل منها."""
+async def index_60(msg: Message, bot: Bot, command: CommandObject):
+    """أرشفة تزايدية: رفع الجديد والمتغيّر فقط وحذف ما أُزيل من المجلد.
+    /index_60 all يعيد رفع كل الصور."""
     if not ADMIN_CHAT_ID or ADMIN_CHAT_ID == "0" or str(msg.chat.id) != str(ADMIN_CHAT_ID):
         return await msg.answer(
             "❌ هذا الأمر مخصص للمدير فقط.\n"
@@ -52,115 +252,393 @@ async def index_60(msg: Message, bot: Bot):
     if not os.path.isdir(IMAGES_DIR):
         return await msg.answer(f"❌ المجلد غير موجود: <code>{IMAGES_DIR}</code>")
 
-    files = [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))]
-    if not files:
+    full = (command.args or "").strip().lower() == "all"
+    try:
+        async with exclusive_archive():
+            return await _index_60(msg, bot, full)
+    except ArchiveBusy:
+        return await msg.answer(ARCHIVE_BUSY)
+
+async def _index_60(msg: Message, bot: Bot, full: bool):
+    manifest = load_manifest(MANIFEST_JSON)
+    current = await scan_images(IMAGES_DIR, manifest)
+    if not current:
         return await msg.answer("📁 لا توجد صور داخل المجلد.")
 
-    files.sort()
-    await msg.answer(f"⏳ بدء الأرشفة… عدد الصور: {len(files)}")
-
-    result_map: Dict[str, str] = {}
-    ok = 0
-
-    for fname in files:
-        code = os.path.splitext(fname)[0]  # مثل: 6600001
-        path = os.path.join(IMAGES_DIR, fname)
-        try:
-            sent = await bot.send_photo(
-                chat_id=msg.chat.id,
-                photo=FSInputFile(path),
-                caption=f"📦 أرشفة عرض {code} — 60×60"
-            )
-            file_id = sent.photo[-1].file_id
-            result_map[code] = file_id
-            ok += 1
-            await asyncio.sleep(0.6)  # لتجنب FloodWait
-        except Exception as e:
-            await msg.answer(f"⚠️ فشل في {fname}: {e}")
-
-    if result_map:
-        save_map(result_map)
-        await msg.answer(
-            f"✅ اكتملت الأرشفة.\n"
-            f"عدد العروض: {ok}\n"
-            f"تم إنشاء الملف: <code>{OFFERS_JSON}</code>"
-        )
-    else:
-        await msg.answer("⚠️ لم يتم أرشفة أي صورة.")
+    offers = catalog.reload().as_map()
+    new, changed, deleted, unchanged = plan_changes(current, manifest, offers)
+    checkpoint = IndexCheckpoint("index_60 all" if full else "index_60", current, manifest, offers)
+    # استئناف: ما رفعه تشغيل سابق انقطع محفوظ في الخريطة والبيان، فلا يُعاد رفعه
+    resumed = checkpoint.resume() if full else set()
+    upload = [c for c in sorted(current) if c not in resumed] if full else new + changed
+    if not upload and not deleted:
+        save_manifest(MANIFEST_JSON, build_manifest(current, manifest, offers, {}))
+        checkpoint.finish()
+        return await msg.answer(f"✅ لا تغييرات. عدد العروض المؤرشفة: {len(offers)}")
+    if resumed:
+        await msg.answer(f"↩️ استئناف أرشفة سابقة: {len(resumed)} صورة مرفوعة مسبقًا.")
+
+    jobs = [
+        (code, os.path.join(IMAGES_DIR, current[code]["file"]), f"📦 أرشفة عرض {code} — 60×60")
+        for code in upload  # code مثل: CG6600001
+    ]
+    uploaded, fails = await upload_with_progress(msg, bot, jobs, "الأرشفة", checkpoint)
+
+    # المتغيّر الذي فشل رفعه يحتفظ بـ file_id القديم حتى المحاولة القادمة
+    keep = (sorted(resumed) if full else unchanged) + [c for c, _ in fails if c in offers]
+    result_map = {c: offers[c] for c in keep}
+    result_map.update(uploaded)
+
+    save_manifest(MANIFEST_JSON, build_manifest(current, manifest, result_map, uploaded))
+    save_map(result_map)
+    checkpoint.finish()
+    report = (
+        f"✅ اكتملت الأرشفة.\n"
+        f"عدد العروض: {len(result_map)}\n"
+        f"🆕 جديد: {len(new)} | 🔄 متغيّر: {len(changed)} | 🗑️ محذوف: {len(deleted)}\n"
+        f"📤 تم رفع: {len(uploaded)}\n"
+        f"تم تحديث الملف: <code>{OFFERS_JSON}</code>"
+    )
+    if fails:
+        report += f"\n⚠️ فشل: {len(fails)}\n" + fails_preview(fails)
+    await msg.answer(report)
 
 # ===== (2) عرض العروض للمستخدم =====
 @router.message(F.text == "📰 أحدث العروض 60×60")
 async def show_offers_60(msg: Message):
     """عرض أول صورة من العروض المؤرشفة."""
-    items = load_items()
-    if not items:
+    cat = catalog.refresh()
+    if not cat.items:
         return await msg.answer("📂 لا توجد عروض مؤرشفة بعد. شغّل الأمر /index_60 أولًا.")
 
-    idx = 0
-    code, file_id = items[idx]
-    caption = (
-        f"🧱 عرض <b>{code}</b> — 60×60\n"
-        f"({idx+1} من {len(items)})\n"
-        f"💬 اطلبه بذكر رقم العرض."
-    )
-    await msg.answer_photo(photo=file_id, caption=caption, reply_markup=nav_kb(idx, len(items)))
+    # أول عرض صورته سليمة؛ إن كانت كلها معلَّمة تالفة نعرض نص الأول
+    idx = next((i for i, (c, f) in enumerate(cat.items) if not broken_ids.is_broken(c, f)), 0)
+    code, file_id = cat.items[idx]
+    if broken_ids.is_broken(code, file_id):
+        return msg.answer(unavailable_caption(code, idx, len(cat.items)), reply_markup=cat.markups[idx])
+    return msg.answer_photo(photo=file_id, caption=cat.captions[idx], reply_markup=cat.markups[idx])
 
 # ===== (3) التنقل بين الصور =====
+# تعديل واحد لكل رسالة: الضغطات السريعة تُدمج ولا يُعرض إلا آخر فهرس مطلوب
+nav = Debouncer(NAV_DEBOUNCE)
+
+async def show_offer(message: Message, idx: int) -> None:
+    cat = catalog.refresh()
+    if idx >= len(cat.items):
+        return
+    code, file_id = cat.items[idx]
+    caption, markup = cat.captions[idx], cat.markups[idx]
+    if broken_ids.is_broken(code, file_id):
+        # لا نعيد تجربة معرّف رفضه تيليجرام: نص بديل حتى يصلحه الفحص أو الأرشفة
+        await message.answer(unavailable_caption(code, idx, len(cat.items)), reply_markup=markup)
+        return
+    try:
+        await message.edit_media(
+            InputMediaPhoto(media=file_id, caption=caption, parse_mode="HTML"),
+            reply_markup=markup
+        )
+    except TelegramBadRequest as e:
+        err = str(e).lower()
+        if "message is not modified" in err:
+            return  # المعروض هو المطلوب أصلًا
+        if "can't be edited" in err or "to edit not found" in err or "no media" in err:
+            # رسالة قديمة/محذوفة (أو نص بديل بلا صورة) لا تقبل التعديل، نرسل واحدة جديدة
+            await message.answer_photo(photo=file_id, caption=caption, reply_markup=markup)
+            return
+        if "wrong file identifier" in err or "file reference" in err:
+            # file_id تالف: تعليمه حتى لا يُعرض مجددًا، وفحص وإصلاح فوري بدل انتظار الدورة التالية
+            broken_ids.mark([(code, file_id)])
+            request_verify()
+            await message.answer(unavailable_caption(code, idx, len(cat.items)), reply_markup=markup)
+            return
+        raise
+
 @router.callback_query(F.data.startswith("offer60:"))
 async def paginate_offers_60(cb: CallbackQuery):
-    """التنقل بين الصور (التالي / السابق / رجوع)."""
-    items = load_items()
+    """التنقل بين الصور (التالي / السابق / رجوع). الرد على الضغطة فوري والتعديل مؤجَّل."""
+    cat = catalog.refresh()
+    items = cat.items
     if not items:
         return await cb.answer("لا توجد بيانات.", show_alert=True)
 
-    action = cb.data.split(":")[1]
-    if action == "back":
-        await cb.message.edit_caption(caption="🔙 رجوع للقائمة.", reply_markup=None)
-        return await cb.answer()
+    key = (cb.message.chat.id, cb.message.message_id)
+    parts = cb.data.split(":")
+    if parts[1] == "back":
+        nav.cancel(key)
+        await cb.answer()
+        return await cb.message.edit_caption(caption="🔙 رجوع للقائمة.", reply_markup=None)
 
     try:
-        idx = int(action)
-    except:
+        if parts[1] in ("p", "n") and len(parts) == 3:
+            # الأساس: آخر هدف لم يُعرض بعد، وإلا الفهرس المعروض في الرسالة
+            pending = nav.target(key)
+            base = int(parts[2]) if pending is None else pending
+            idx = base + (1 if parts[1] == "n" else -1)
+        else:
+            idx = int(parts[1])  # الصيغة القديمة offer60:{n} في رسائل سابقة
+    except ValueError:
         return await cb.answer("⚠️ خطأ في الفهرس.")
 
     if idx < 0 or idx >= len(items):
         return await cb.answer("🚫 وصلت للنهاية.")
 
-    code, file_id = items[idx]
+    nav.submit(key, idx, lambda i: show_offer(cb.message, i))
+    return await cb.answer()
+
+# ===== (4) وضع الصفحات: ألبوم / شبكة معاينة =====
+sheets = SheetCache(SHEETS_JSON)
+# بصمة الصفحة → [القفل، عدد من يحمله أو ينتظره]؛ يُحذف فقط عندما لا يبقى أحد
+_sheet_locks: Dict[str, list] = {}
+
+def _local_paths() -> Dict[str, str]:
+    """code → مسار الصورة الأصلية في المجلد (إن وُجدت محليًا)."""
+    if not os.path.isdir(IMAGES_DIR):
+        return {}
+    return {
+        os.path.splitext(f)[0]: os.path.join(IMAGES_DIR, f)
+        for f in os.listdir(IMAGES_DIR) if f.lower().endswith(IMAGE_EXTS)
+    }
+
+def _range_text(start: int, end: int, total: int) -> str:
+    return f"العروض {start+1}–{end} من {total}"
+
+async def send_album_page(message: Message, page: int) -> None:
+    """حتى 10 صور (file_id مخزّنة) في رسالة ألبوم واحدة + رسالة أزرار للصفحة التالية."""
+    items = catalog.refresh().items
+    pages = -(-len(items) // ALBUM_SIZE)
+    page = min(max(page, 0), pages - 1)
+    chunk = items[page * ALBUM_SIZE:(page + 1) * ALBUM_SIZE]
+    shown = visible(chunk)
+    if len(shown) == 1:
+        # sendMediaGroup يتطلب 2–10 عناصر: الصفحة ذات الصورة الواحدة تُرسل كصورة عادية
+        code, fid = shown[0]
+        await message.answer_photo(photo=fid, caption=f"🧱 {code}")
+    elif shown:
+        await message.answer_media_group([InputMediaPhoto(media=fid, caption=f"🧱 {code}") for code, fid in shown])
+    end = page * ALBUM_SIZE + len(chunk)
+    await message.answer(
+        f"🗂️ {_range_text(page * ALBUM_SIZE, end, len(items))}{unavailable_note(chunk, shown)}\n"
+        f"💬 اطلبه بذكر رقم العرض.",
+        reply_markup=page_kb("a", page, pages),
+    )
+
+async def _sheet_tiles(bot: Bot, chunk: List[Tuple[str, str]]) -> List[Tuple[str, object]]:
+    """مصادر المصغّرات: الملف المحلي إن وُجد، وإلا تنزيل الصورة من تيليجرام."""
+    local = _local_paths()
+    tiles = []
+    for code, fid in chunk:
+        if code in local:
+            tiles.append((code, local[code]))
+        else:
+            try:
+                buf = await bot.download(fid)
+                tiles.append((code, buf.getvalue()))
+            except Exception as e:
+                print(f"⚠️ grid: تعذّر تنزيل {code}: {e}")
+                tiles.append((code, b""))  # خانة فارغة بدل إسقاط الصفحة كلها
+    return tiles
+
+async def send_grid_page(message: Message, bot: Bot, page: int) -> None:
+    """صورة واحدة لكل GRID_PAGE عرض؛ تُولَّد مرة واحدة ثم يُعاد إرسال file_id المحفوظ."""
+    items = catalog.refresh().items
+    pages = -(-len(items) // GRID_PAGE)
+    page = min(max(page, 0), pages - 1)
+    chunk = items[page * GRID_PAGE:(page + 1) * GRID_PAGE]
+    shown = visible(chunk)
     caption = (
-        f"🧱 عرض <b>{code}</b> — 60×60\n"
-        f"({idx+1} من {len(items)})\n"
-        f"💬 اطلبه بذكر رقم العرض."
+        f"🔲 {_range_text(page * GRID_PAGE, page * GRID_PAGE + len(chunk), len(items))}"
+        f"{unavailable_note(chunk, shown)}\n💬 اطلبه بذكر رقم العرض."
     )
+    markup = page_kb("g", page, pages)
+    if not shown:
+        await message.answer(caption, reply_markup=markup)
+        return
+    key = sheet_key(shown, f"{GRID_COLS}x{GRID_THUMB}")
+
+    file_id = sheets.get(key)
+    if file_id:
+        try:
+            await message.answer_photo(photo=file_id, caption=caption, reply_markup=markup)
+            return
+        except TelegramBadRequest:
+            sheets.discard(key)  # file_id لم يعد صالحًا → توليد من جديد
+
+    entry = _sheet_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
     try:
-        await cb.message.edit_media(
-            InputMediaPhoto(media=file_id, caption=caption, parse_mode="HTML"),
-            reply_markup=nav_kb(idx, len(items))
-        )
-    except:
-        # أحيانًا لا يمكن تعديل الرسالة، نرسل واحدة جديدة
-        await cb.message.answer_photo(photo=file_id, caption=caption, reply_markup=nav_kb(idx, len(items)))
+        async with entry[0]:  # طلبات متزامنة لنفس الصفحة تولّدها مرة واحدة
+            file_id = sheets.get(key)
+            if file_id:
+                await message.answer_photo(photo=file_id, caption=caption, reply_markup=markup)
+                return
+            tiles = await _sheet_tiles(bot, shown)
+            data = await asyncio.to_thread(
+                render_contact_sheet, tiles, cols=GRID_COLS, thumb=GRID_THUMB, font_path=FONT_PATH
+            )
+            sent = await message.answer_photo(
+                BufferedInputFile(data, filename=f"offers_60_{page+1}.jpg"), caption=caption, reply_markup=markup
+            )
+            sheets.put(key, sent.photo[-1].file_id)
+    finally:
+        # الحذف حتى عند فشل التوليد/الرفع، ولا يُحذف قفل ما زال أحد ينتظره
+        entry[1] -= 1
+        if not entry[1] and _sheet_locks.get(key) is entry:
+            del _sheet_locks[key]
+
+@router.callback_query(F.data.startswith("offer60pg:"))
+async def offers_60_pages(cb: CallbackQuery, bot: Bot):
+    """offer60pg:a:<page> للألبوم، offer60pg:g:<page> لشبكة المعاينة."""
+    if not catalog.refresh().items:
+        return await cb.answer("لا توجد بيانات.", show_alert=True)
+    try:
+        _, kind, page = cb.data.split(":")
+        page = int(page)
+    except ValueError:
+        return await cb.answer("⚠️ خطأ في الصفحة.")
     await cb.answer()
+    if kind == "g" and contact_sheet.available():
+        await send_grid_page(cb.message, bot, page)
+    else:
+        await send_album_page(cb.message, page if kind == "a" else page * GRID_PAGE // ALBUM_SIZE)
+
+# ===== (5) فحص صلاحية file_id وإعادة رفع التالف =====
+_verify_wake = asyncio.Event()
+_verify_task: Optional[asyncio.Task] = None
+
+def request_verify() -> None:
+    _verify_wake.set()
+
+async def verify_offers(bot: Bot, on_progress=None) -> Tuple[str, bool]:
+    """فحص كل file_id المؤرشفة عبر getFile، ثم إعادة رفع التالف فقط من المجلد.
+    يعيد (نص الملخص، هل وُجد ما يستحق التنبيه). يُستدعى تحت exclusive_archive()."""
+    items = catalog.refresh().items
+    limiter = AdaptiveRateLimiter(rate=VERIFY_RATE, max_rate=VERIFY_RATE, burst=VERIFY_RATE)
+    broken, unknown = await verify_file_ids(
+        bot, items, concurrency=VERIFY_CONCURRENCY, limiter=limiter, on_progress=on_progress,
+    )
+    uploaded, fails, missing = {}, [], []
+    if broken:
+        local = _local_paths()
+        missing = [c for c, _ in broken if c not in local]
+        jobs = [(c, local[c], f"📦 إعادة أرشفة {c} — 60×60") for c, _ in broken if c in local]
+        if jobs and ADMIN_CHAT_ID and ADMIN_CHAT_ID != "0":
+            uploaded, fails = await upload_photos(
+                bot, int(ADMIN_CHAT_ID), jobs, concurrency=UPLOAD_CONCURRENCY,
+                limiter=AdaptiveRateLimiter(max_rate=UPLOAD_MAX_RATE),
+            )
+        if uploaded:
+            # إعادة قراءة الخريطة من الملف (ربما كتبها عامل آخر) ودمج ما زال موجودًا فقط
+            manifest = load_manifest(MANIFEST_JSON)
+            current = await scan_images(IMAGES_DIR, manifest)
+            result_map = catalog.reload().as_map()
+            uploaded = {c: fid for c, fid in uploaded.items() if c in result_map}
+            result_map.update(uploaded)
+            save_manifest(MANIFEST_JSON, build_manifest(current, manifest, result_map, uploaded))
+            save_map(result_map)
+        # ما لم يُصلَح يبقى معلَّمًا فلا يُعرض للعملاء حتى تُعاد أرشفته
+        file_ids = dict(items)
+        broken_ids.mark((c, file_ids[c]) for c, _ in broken if c not in uploaded)
+
+    lines = [
+        f"🩺 فحص صور 60×60: {len(items)} معرّف",
+        f"✅ سليم: {len(items) - len(broken) - len(unknown)} | ❌ تالف: {len(broken)} | ❔ لم يُحسم: {len(unknown)}",
+    ]
+    if broken:
+        lines.append(f"📤 أُعيد رفع: {len(uploaded)}")
+    if missing:
+        lines.append("⚠️ تالف بلا صورة في المجلد: " + ", ".join(missing[:20]))
+    if fails:
+        lines.append(f"⚠️ فشل إعادة الرفع: {len(fails)}\n" + fails_preview(fails))
+    if unknown:
+        lines.append("ℹ️ أخطاء شبكة (يُعاد فحصها لاحقًا):\n" + fails_preview(unknown))
+    return "\n".join(lines), bool(broken or unknown)
+
+async def _verify_locked(bot: Bot, on_progress=None) -> Optional[Tuple[str, bool]]:
+    """None إذا كانت أرشفة أو فحص آخر جاريًا (في هذه العملية أو في عامل آخر)."""
+    try:
+        async with exclusive_archive():
+            return await verify_offers(bot, on_progress)
+    except ArchiveBusy:
+        return None
+
+async def verify_loop(bot: Bot) -> None:
+    delay = VERIFY_FIRST_DELAY
+    while True:
+        try:
+            await asyncio.wait_for(_verify_wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        _verify_wake.clear()
+        delay = VERIFY_INTERVAL
+        try:
+            if not catalog.refresh().items:
+                continue
+            result = await _verify_locked(bot)
+            if result is None:
+                continue
+            summary, notable = result
+            print(summary)
+            if notable and ADMIN_CHAT_ID and ADMIN_CHAT_ID != "0":
+                await bot.send_message(ADMIN_CHAT_ID, summary)
+        except Exception as e:
+            print(f"⚠️ verify_60: {e}")
+
+@router.startup()
+async def start_verifier(bot: Bot):
+    global _verify_task
+    if VERIFY_INTERVAL > 0 and _verify_task is None:
+        _verify_task = asyncio.create_task(verify_loop(bot))
+
+@router.shutdown()
+async def stop_verifier():
+    global _verify_task
+    if _verify_task is not None:
+        _verify_task.cancel()
+        try:
+            await _verify_task
+        except asyncio.CancelledError:
+            pass
+        _verify_task = None
+
+@router.message(Command("verify_60"))
+async def verify_60(msg: Message, bot: Bot):
+    """فحص فوري لكل file_id وإعادة رفع التالف (للمدير)."""
+    if not ADMIN_CHAT_ID or ADMIN_CHAT_ID == "0" or str(msg.chat.id) != str(ADMIN_CHAT_ID):
+        return await msg.answer("❌ هذا الأمر للمدير فقط. اضبط ADMIN_CHAT_ID في .env.")
+    if not catalog.refresh().items:
+        return await msg.answer("📂 لا توجد عروض مؤرشفة بعد.")
+    status = await msg.answer("⏳ فحص الصور…")
+    progress = ProgressMessage(status)
+
+    async def on_progress(done: int, total: int):
+        await progress.update(f"⏳ فحص الصور… ({done}/{total})")
+
+    result = await _verify_locked(bot, on_progress)
+    if result is None:
+        return await progress.update(ARCHIVE_BUSY, force=True)
+    await progress.update(result[0], force=True)
+
 # ===== (أوامر مساعدة) فحص وإكمال المفقود =====
 def _dir_codes() -> List[str]:
     """الأكواد المستخرجة من أسماء ملفات المجلد (بدون الامتداد)."""
     if not os.path.isdir(IMAGES_DIR):
         return []
-    files = [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))]
+    files = [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith(IMAGE_EXTS)]
     return sorted([os.path.splitext(f)[0] for f in files])
 
-def _json_codes() -> List[str]:
-    """الأكواد الموجودة داخل JSON (المؤرشفة)."""
-    return [k for k, _ in load_items()]
+def _json_codes() -> Dict[str, int]:
+    """الأكواد الموجودة داخل JSON (المؤرشفة) — قاموس مرتب للبحث بـ O(1)."""
+    return catalog.refresh().index
 
 @router.message(Command("check_60"))
 async def check_60(msg: Message):
     """تقرير الفروقات بين المجلد وملف JSON."""
     codes_dir = _dir_codes()
     codes_json = _json_codes()
+    dir_set = set(codes_dir)
 
     missing = [c for c in codes_dir if c not in codes_json]
-    extra = [c for c in codes_json if c not in codes_dir]  # حالات قديمة لو حُذفت صورة من المجلد
+    extra = [c for c in codes_json if c not in dir_set]  # حالات قديمة لو حُذفت صورة من المجلد
 
     report = [
         f"📁 في المجلد: {len(codes_dir)} صورة",
@@ -185,61 +663,39 @@ async def index_60_missing(msg: Message, bot: Bot):
     """أرشفة المفقود فقط (حسب مقارنة المجلد مع JSON)."""
     if not ADMIN_CHAT_ID or ADMIN_CHAT_ID == "0" or str(msg.chat.id) != str(ADMIN_CHAT_ID):
         return await msg.answer("❌ هذا الأمر للمدير فقط. اضبط ADMIN_CHAT_ID في .env.")
-
-    codes_dir = _dir_codes()
-    if not codes_dir:
+    try:
+        async with exclusive_archive():
+            return await _index_60_missing(msg, bot)
+    except ArchiveBusy:
+        return await msg.answer(ARCHIVE_BUSY)
+
+async def _index_60_missing(msg: Message, bot: Bot):
+    manifest = load_manifest(MANIFEST_JSON)
+    current = await scan_images(IMAGES_DIR, manifest)
+    if not current:
         return await msg.answer(f"❌ لا توجد صور في المجلد: <code>{IMAGES_DIR}</code>")
 
-    codes_json = _json_codes()
-    missing = [c for c in codes_dir if c not in codes_json]
+    # الخريطة الحالية (من الكتالوج المحمّل) لنضيف عليها
+    current_map = catalog.reload().as_map()
+    missing = [c for c in current if c not in current_map]
 
     if not missing:
         return await msg.answer("✅ لا توجد عناصر مفقودة. كل شيء مؤرشف.")
 
-    await msg.answer(f"⏳ البدء في أرشفة المفقود… ({len(missing)} عنصر)")
-
-    # حمّل الخريطة الحالية (إن وُجدت) لنضيف عليها
-    current_map = {}
-    if os.path.exists(OFFERS_JSON):
-        try:
-            with open(OFFERS_JSON, "r", encoding="utf-8") as f:
-                current_map = json.load(f)
-        except Exception:
-            current_map = {}
-
-    ok, fails = 0, []
-    for code in missing:
-        path_jpg = os.path.join(IMAGES_DIR, f"{code}.jpg")
-        path_jpeg = os.path.join(IMAGES_DIR, f"{code}.jpeg")
-        path_png = os.path.join(IMAGES_DIR, f"{code}.png")
-        path_webp = os.path.join(IMAGES_DIR, f"{code}.webp")
-
-        # اختر أول امتداد موجود فعليًا
-        path = None
-        for p in (path_jpg, path_jpeg, path_png, path_webp):
-            if os.path.exists(p):
-                path = p
-                break
-
-        if not path:
-            fails.append((code, "الملف غير موجود بامتداد معروف"))
-            continue
-
-        try:
-            sent = await bot.send_photo(
-                chat_id=msg.chat.id,
-                photo=FSInputFile(path),
-                caption=f"📦 أرشفة مفقود {code} — 60×60"
-            )
-            file_id = sent.photo[-1].file_id
-            current_map[code] = file_id
-            ok += 1
-            await asyncio.sleep(0.6)
-        except Exception as e:
-            fails.append((code, str(e)))
+    jobs = [
+        (code, os.path.join(IMAGES_DIR, current[code]["file"]), f"📦 أرشفة مفقود {code} — 60×60")
+        for code in missing
+    ]
+    # الحفظ الدوري يكفي للاستئناف هنا: ما رُفع يدخل الخريطة فلا يعود "مفقودًا"
+    checkpoint = IndexCheckpoint("index_60_missing", current, manifest, current_map)
+    uploaded, fails = await upload_with_progress(msg, bot, jobs, "أرشفة المفقود", checkpoint)
+    current_map.update(uploaded)
+    ok = len(uploaded)
 
     # حفظ التحديث
+    save_manifest(MANIFEST_JSON, build_manifest(current, manifest, current_map, uploaded))
     save_map(current_map)
+    checkpoint.finish()
 
     # ملخص
     lines = [
@@ -247,9 +703,6 @@ async def index_60_missing(msg: Message, bot: Bot):
         f"⚠️ فشل: {len(fails)}"
     ]
     if fails:
-        # نعرض أول 10 أخطاء لتقليل الازدحام
-        preview_fails = "\n".join([f"- {c}: {err}" for c, err in fails[:10]])
-        more_f = f"\n… (+{len(fails)-10} حالات أخرى)" if len(fails) > 10 else ""
-        lines.append(preview_fails + more_f)
+        lines.append(fails_preview(fails))
 
     await msg.answer("\n".join(lines))
@@ -0,0 +1,76 @@
+# handlers/offers_search.py
+# البحث المباشر (inline mode): @البوت 66000 أو @البوت لامع — نتائج صور مؤرشفة (file_id)
+# من فهرس بادئات في الذاكرة يُبنى مرة واحدة لكل إصدار من كتالوج العروض/الأسعار.
+# ⚠️ يلزم تفعيل Inline Mode للبوت من BotFather (/setinline).
+import os
+from typing import List, Optional, Tuple
+
+from aiogram import Router
+from aiogram.types import InlineQuery, InlineQueryResultCachedPhoto
+
+from services.prefix_index import PrefixIndex, code_terms
+from services.price_catalog import price_catalog
+from handlers.offers_60 import catalog
+
+router = Router(name="offers_search_router")
+
+# ===== إعدادات عامة =====
+INLINE_PAGE = 50  # أقصى عدد نتائج في الرد الواحد عند تيليجرام
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))  # تخزين النتائج على خوادم تيليجرام (ثوانٍ)
+
+_index: Optional[PrefixIndex] = None
+_index_stamp: Tuple[int, int] = (-1, -1)
+
+def search_index() -> PrefixIndex:
+    """الفهرس الحالي؛ يُعاد بناؤه فقط عند تغيّر إصدار الكتالوج أو الأسعار."""
+    global _index, _index_stamp
+    cat, prices = catalog.refresh(), price_catalog.refresh()
+    stamp = (cat.version, prices.version)
+    if _index is None or stamp != _index_stamp:
+        entries = []
+        for i, (code, _) in enumerate(cat.items):
+            terms = code_terms(code)
+            product = prices.products.get(code)
+            if product:
+                terms += product.name.split() + [w for t in product.tags for w in t.split()]
+            entries.append((i, terms))
+        _index, _index_stamp = PrefixIndex(entries), stamp
+    return _index
+
+def search_caption(code: str) -> str:
+    product = price_catalog.get(code)
+    price = f"💰 السعر: {product.price:g} د.ل / {product.unit}\n" if product else ""
+    return f"🧱 عرض <b>{code}</b> — 60×60\n{price}💬 اطلبه بذكر رقم العرض."
+
+def search_results(query: str, offset: int) -> Tuple[List[InlineQueryResultCachedPhoto], str]:
+    """صفحة من النتائج + next_offset (فارغ عند النهاية). الاستعلام الفارغ = كل العروض."""
+    cat = catalog.refresh()
+    ids = search_index().search(query) if query.strip() else range(len(cat.items))
+    page = ids[offset:offset + INLINE_PAGE]
+    results = []
+    for i in page:
+        code, file_id = cat.items[i]
+        product = price_catalog.get(code)
+        results.append(InlineQueryResultCachedPhoto(
+            id=code,
+            photo_file_id=file_id,
+            title=code,
+            description=f"{product.price:g} د.ل / {product.unit}" if product else None,
+            caption=search_caption(code),
+        ))
+    more = offset + INLINE_PAGE < len(ids)
+    return results, str(offset + INLINE_PAGE) if more else ""
+
+@router.inline_query()
+async def offers_inline_search(query: InlineQuery):
+    try:
+        offset = int(query.offset or 0)
+    except ValueError:
+        offset = 0
+    results, next_offset = search_results(query.query, offset)
+    return query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=False,  # نفس النتائج للجميع → يعيد تيليجرام استخدامها دون سؤال البوت
+        next_offset=next_offset,
+    )
@@ -3,16 +3,22 @@
 Tile Calculator + Arabic PDF + Logo (Aiogram v3)
 - Main menu: Kitchen/Bath/Floors/Flat
 - Dual input modes (dimensions OR direct areas)
-- Fixed prices: wall=29, floor=29 (per m²), decor=20, strip=10 (per unit)
+- Prices from products.json (hot-reloaded): defaults wall/floor/decor/strip + per-product codes
 - Arabic-shaped PDF with Amiri font + optional logo
+- Pricing itself lives in services/quote_engine.py (shared with POST /api/quote)
 """
 
 from __future__ import annotations
 import os
 import io
-import math
+import json
+import asyncio
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 from aiogram import Router, F
 from aiogram.types import (
@@ -20,10 +26,12 @@ from aiogram.types import (
     ReplyKeyboardRemove, BufferedInputFile,
     ReplyKeyboardMarkup, KeyboardButton
 )
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.utils.chat_action import ChatActionSender
 
 # ---- PDF / Arabic shaping ----
 from reportlab.lib.pagesizes import A4
@@ -32,6 +40,14 @@ from reportlab.lib.units import cm
 from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.utils import ImageReader
+
+from services.invoice_cache import InvoiceCache
+from services.quote_engine import (
+    DEFAULT_HEIGHT_M, Line, SpaceInvoice, space_name,
+    kb_space_from_dims, kb_space_from_areas, ff_space,
+)
+from services.price_catalog import price_catalog
 
 # Optional Arabic shaping
 try:
@@ -43,57 +59,45 @@ except Exception:
 
 router = Router(name="tile_calculator_pdf")
 
-# ---------- Pricing Constants ----------
-PRICE_WALL_PER_M2 = 29.0
-PRICE_FLOOR_PER_M2 = 29.0
-PRICE_DECOR_PER_UNIT = 20.0
-PRICE_STRIP_PER_UNIT = 10.0
+AR_CACHE_SIZE = int(os.getenv("AR_CACHE_SIZE", "4096"))  # shaped strings kept per process
 
-DEFAULT_HEIGHT_M = 3.2  # for kitchen/bath when using dimensions or area (default)
+# ---------- PDF rendering pool ----------
+PDF_EXECUTOR = os.getenv("PDF_EXECUTOR", "thread").strip().lower()  # thread | process
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_MAX_CONCURRENT = int(os.getenv("PDF_MAX_CONCURRENT", str(PDF_WORKERS)))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "30"))  # seconds
+PDF_LAYOUT_VERSION = 1  # bump when build_pdf output changes, to invalidate cached invoices
+INVOICE_CACHE_MB = int(os.getenv("INVOICE_CACHE_MB", "32"))
 
 # ---------- Helpers ----------
-def ceildiv(a: float, b: float) -> int:
-    return math.ceil(a / b)
-
 def safe_float(text: str) -> Optional[float]:
     try:
         return float(str(text).replace(",", ".").strip())
     except Exception:
         return None
 
+@lru_cache(maxsize=AR_CACHE_SIZE)
+def _shape(s: str) -> str:
+    try:
+        reshaped = arabic_reshaper.reshape(s)
+        return get_display(reshaped)
+    except Exception:
+        return s
+
 def ar(s: str) -> str:
     if not isinstance(s, str):
         s = str(s)
     if _ARABIC_OK:
-        try:
-            reshaped = arabic_reshaper.reshape(s)
-            return get_display(reshaped)
-        except Exception:
-            return s
+        return _shape(s)
     return s
 
-# ---------- Data Models ----------
-@dataclass
-class Line:
-    label: str
-    unit: str
-    qty: float
-    price: float
-    @property
-    def total(self) -> float:
-        return round(self.qty * self.price, 2)
+def ar_many(strings: Iterable[str]) -> Dict[str, str]:
+    """Shape every distinct string once; returns raw -> shaped."""
+    return {s: ar(s) for s in dict.fromkeys(strings)}
 
-@dataclass
-class SpaceInvoice:
-    name: str
-    category: str  # kitchen|bath|floor|flat
-    perimeter_m: float = 0.0
-    height_m: float = DEFAULT_HEIGHT_M
-    wall_area_m2: float = 0.0
-    floor_area_m2: float = 0.0
-    lines: List[Line] = field(default_factory=list)
-    def compute_totals(self) -> float:
-        return round(sum(l.total for l in self.lines), 2)
+def ar_cache_info() -> Dict[str, int]:
+    info = _shape.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
 
 # ---------- FSM ----------
 class TileFlow(StatesGroup):
@@ -115,6 +119,7 @@ class TileFlow(StatesGroup):
     ff_length = State()
     ff_width = State()
     ff_area = State()
+    ff_product = State()
 
     after_space_summary = State()
 
@@ -153,6 +158,11 @@ def edit_height_kb() -> InlineKeyboardBuilder:
     kb.adjust(2)
     return kb
 
+def skip_product_kb() -> InlineKeyboardBuilder:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="تخطي (السعر الافتراضي)", callback_data="skip_product")
+    return kb
+
 def restart_kb() -> InlineKeyboardBuilder:
     kb = InlineKeyboardBuilder()
     kb.button(text="🔁 بدء جديد (حاسبة)", callback_data="restart_calc")
@@ -176,23 +186,43 @@ def main_reply_kb() -> ReplyKeyboardMarkup:
 # ---------- Session ----------
 SESSION_KEY = "tile_session"
 
-@dataclass
+@dataclass(slots=True)
 class SessionData:
     counters: Dict[str, int] = field(default_factory=lambda: {"kitchen":0, "bath":0, "floor":0, "flat":0})
     spaces: List[SpaceInvoice] = field(default_factory=list)
 
+    def to_state(self) -> dict:
+        """JSON-safe form stored in FSM data (works with any storage backend)."""
+        return {"counters": dict(self.counters), "spaces": [sp.to_tuple() for sp in self.spaces]}
+
+    @classmethod
+    def from_state(cls, raw: dict) -> "SessionData":
+        spaces = []
+        for sp in raw.get("spaces", []):
+            if isinstance(sp, dict):  # field-name form used before the tuple encoding
+                lines = tuple(Line(**ln) for ln in sp.get("lines", []))
+                spaces.append(SpaceInvoice(**{**sp, "lines": lines}))
+            else:
+                spaces.append(SpaceInvoice.from_tuple(sp))
+        return cls(counters=dict(raw.get("counters", {})), spaces=spaces)
+
 async def get_session(state: FSMContext) -> SessionData:
     data = await state.get_data()
-    s: SessionData = data.get(SESSION_KEY)
-    if not s:
+    raw = data.get(SESSION_KEY)
+    if not raw:
         s = SessionData()
-        await state.update_data(**{SESSION_KEY: s})
-    return s
+        await save_session(state, s)
+        return s
+    return SessionData.from_state(raw)
 
-async def push_space(state: FSMContext, space: SpaceInvoice):
-    s = await get_session(state)
+async def save_session(state: FSMContext, s: SessionData):
+    # the session is a decoded copy, so every change must be written back
+    await state.update_data(**{SESSION_KEY: s.to_state()})
+
+async def push_space(state: FSMContext, space: SpaceInvoice, s: Optional[SessionData] = None):
+    s = s or await get_session(state)
     s.spaces.append(space)
-    await state.update_data(**{SESSION_KEY: s})
+    await save_session(state, s)
 
 # ---------- Entry ----------
 @router.message(Command("tile"))
@@ -338,62 +368,26 @@ async def kb_height_value_area(m: Message, state: FSMContext):
     await finalize_kb_area(m, state, wall_area, floor_area, H)
 
 async def finalize_kb_dim(m: Message, state: FSMContext, L: float, W: float, H: float):
-    perimeter = 2 * (L + W)
-    wall_area = perimeter * H
-    floor_area = L * W
-
     data = await state.get_data()
     s = await get_session(state)
     kind = data.get("current_kind")
     s.counters[kind] += 1
-    idx = s.counters[kind]
-    name = ("مطبخ " if kind == "kitchen" else "حمّام ") + str(idx)
+    space = kb_space_from_dims(space_name(kind, s.counters[kind]), kind, L, W, H, price_catalog.prices())
 
-    decor_units = ceildiv(perimeter, 0.6)
-    strip_units = decor_units * 2
-
-    space = SpaceInvoice(
-        name=name, category=kind,
-        perimeter_m=round(perimeter, 2), height_m=H,
-        wall_area_m2=round(wall_area, 2), floor_area_m2=round(floor_area, 2)
-    )
-    space.lines.extend([
-        Line("حائط", "م²", qty=round(wall_area, 2), price=PRICE_WALL_PER_M2),
-        Line("أرضية", "م²", qty=round(floor_area, 2), price=PRICE_FLOOR_PER_M2),
-        Line("ديكورات", "قطعة", qty=float(decor_units), price=PRICE_DECOR_PER_UNIT),
-        Line("استريشات", "قطعة", qty=float(strip_units), price=PRICE_STRIP_PER_UNIT),
-    ])
-
-    await push_space(state, space)
+    await push_space(state, space, s)
     await show_space_summary(m, state, space)
     await state.set_state(TileFlow.after_space_summary)
 
 async def finalize_kb_area(m: Message, state: FSMContext, wall_area: float, floor_area: float, H: float):
-    perimeter = (wall_area / H) if H and H > 0 else 0.0
-
     data = await state.get_data()
     s = await get_session(state)
     kind = data.get("current_kind")
     s.counters[kind] += 1
-    idx = s.counters[kind]
-    name = ("مطبخ " if kind == "kitchen" else "حمّام ") + str(idx)
-
-    decor_units = ceildiv(perimeter, 0.6)
-    strip_units = decor_units * 2
-
-    space = SpaceInvoice(
-        name=name, category=kind,
-        perimeter_m=round(perimeter, 2), height_m=H,
-        wall_area_m2=round(wall_area, 2), floor_area_m2=round(floor_area, 2)
+    space = kb_space_from_areas(
+        space_name(kind, s.counters[kind]), kind, wall_area, floor_area, H, price_catalog.prices()
     )
-    space.lines.extend([
-        Line("حائط", "م²", qty=round(wall_area, 2), price=PRICE_WALL_PER_M2),
-        Line("أرضية", "م²", qty=round(floor_area, 2), price=PRICE_FLOOR_PER_M2),
-        Line("ديكورات", "قطعة", qty=float(decor_units), price=PRICE_DECOR_PER_UNIT),
-        Line("استريشات", "قطعة", qty=float(strip_units), price=PRICE_STRIP_PER_UNIT),
-    ])
-
-    await push_space(state, space)
+
+    await push_space(state, space, s)
     await show_space_summary(m, state, space)
     await state.set_state(TileFlow.after_space_summary)
 
@@ -415,29 +409,49 @@ async def ff_width(m: Message, state: FSMContext):
     data = await state.get_data()
     L = float(data.get("ff_length"))
     area = L * float(val)
-    await finalize_ff_space(m, state, area)
+    await ask_ff_product(m, state, area)
 
 @router.message(TileFlow.ff_area)
 async def ff_area(m: Message, state: FSMContext):
     val = safe_float(m.text)
     if val is None or val < 0:
         return await m.answer("أدخل مساحة صحيحة (م²).")
-    await finalize_ff_space(m, state, val)
+    await ask_ff_product(m, state, val)
+
+async def ask_ff_product(m: Message, state: FSMContext, area: float):
+    await state.update_data(ff_area_val=area)
+    await state.set_state(TileFlow.ff_product)
+    await m.answer(
+        "أدخل كود الصنف (مثال CG6600001) لاحتساب سعره، أو اضغط تخطي:",
+        reply_markup=skip_product_kb().as_markup()
+    )
+
+@router.message(TileFlow.ff_product)
+async def ff_product(m: Message, state: FSMContext):
+    product = price_catalog.get(m.text or "")
+    if product is None:
+        return await m.answer("❌ كود غير موجود في الكتالوج. أعد المحاولة أو اضغط تخطي.",
+                              reply_markup=skip_product_kb().as_markup())
+    data = await state.get_data()
+    await finalize_ff_space(m, state, float(data.get("ff_area_val", 0.0)), product)
 
-async def finalize_ff_space(m: Message, state: FSMContext, area: float):
+@router.callback_query(F.data == "skip_product")
+async def cb_skip_product(cq: CallbackQuery, state: FSMContext):
+    if await state.get_state() != TileFlow.ff_product.state:
+        return await cq.answer()
+    data = await state.get_data()
+    await finalize_ff_space(cq.message, state, float(data.get("ff_area_val", 0.0)))
+    await cq.answer()
+
+async def finalize_ff_space(m: Message, state: FSMContext, area: float, product=None):
     data = await state.get_data()
     kind = data.get("current_kind")
 
     s = await get_session(state)
     s.counters[kind] += 1
-    idx = s.counters[kind]
-    base = "أرضية " if kind == "floor" else "مساحة مسطّحة "
-    name = base + str(idx)
+    space = ff_space(space_name(kind, s.counters[kind]), kind, area, price_catalog.prices(), product)
 
-    space = SpaceInvoice(name=name, category=kind, wall_area_m2=0.0, floor_area_m2=round(area, 2))
-    space.lines.append(Line("صنف 1", "م²", qty=round(area, 2), price=PRICE_FLOOR_PER_M2))
-
-    await push_space(state, space)
+    await push_space(state, space, s)
     await show_space_summary(m, state, space)
     await state.set_state(TileFlow.after_space_summary)
 
@@ -447,7 +461,7 @@ async def show_space_summary(m: Message, state: FSMContext, space: SpaceInvoice)
     if space.category in {"kitchen", "bath"}:
         lines.append(f"• المحيط: {space.perimeter_m} م | الارتفاع: {space.height_m} م")
         lines.append(f"• الحائط: {space.wall_area_m2} م² | الأرضية: {space.floor_area_m2} م²")
-    total = space.compute_totals()
+    total = space.total
     lines.append("")
     for ln in space.lines:
         lines.append(f"- {ln.label}: {ln.qty} {ln.unit} × {ln.price} = {ln.total}")
@@ -479,11 +493,34 @@ async def export_pdf(cq: CallbackQuery, state: FSMContext):
     if not s.spaces:
         await cq.message.answer("لا توجد بيانات بعد.")
         return await cq.answer()
+    await cq.answer()
 
-    pdf_bytes = build_pdf(s.spaces)
-    file_name = "فاتورة_السيراميك.pdf"
-    doc = BufferedInputFile(pdf_bytes, filename=file_name)
-    await cq.message.answer_document(doc)
+    # identical invoices (same spaces and prices) reuse the rendered PDF or its file_id
+    key = invoice_key(s.spaces)
+    cached = invoice_cache.get(key)
+    delivered = False
+    if cached and cached.file_id:
+        try:
+            await cq.message.answer_document(cached.file_id)
+            delivered = True
+        except TelegramBadRequest:
+            invoice_cache.set_file_id(key, None)
+
+    if not delivered:
+        # "uploading document" stays visible while the pool renders and the file uploads
+        async with ChatActionSender.upload_document(bot=cq.bot, chat_id=cq.message.chat.id):
+            pdf_bytes = cached.pdf if cached and cached.pdf else None
+            if pdf_bytes is None:
+                try:
+                    pdf_bytes = await render_pdf(s.spaces)
+                except asyncio.TimeoutError:
+                    return await cq.message.answer("⚠️ تعذّر إنشاء الفاتورة الآن بسبب الضغط، حاول مرة أخرى بعد قليل.")
+                invoice_cache.put_pdf(key, pdf_bytes)
+            file_name = "فاتورة_السيراميك.pdf"
+            doc = BufferedInputFile(pdf_bytes, filename=file_name)
+            sent = await cq.message.answer_document(doc)
+            if sent.document:
+                invoice_cache.set_file_id(key, sent.document.file_id)
 
     # اخرج من الحالة
     await state.clear()
@@ -493,11 +530,10 @@ async def export_pdf(cq: CallbackQuery, state: FSMContext):
         "تم إنشاء الفاتورة ✅\nهل ترغب بالبدء من جديد أو العودة للقائمة الرئيسية؟",
         reply_markup=restart_kb().as_markup()
     )
-    await cq.answer()
 
 @router.callback_query(F.data == "restart_calc")
 async def restart_calc(cq: CallbackQuery, state: FSMContext):
-    await state.update_data(**{SESSION_KEY: SessionData()})
+    await state.update_data(**{SESSION_KEY: SessionData().to_state()})
     await state.set_state(TileFlow.choosing_category)
     await cq.message.answer("📊 حاسبة السيراميك — اختر النوع:", reply_markup=ReplyKeyboardRemove())
     await cq.message.answer("اختر من القائمة:", reply_markup=main_menu_kb().as_markup())
@@ -510,6 +546,20 @@ async def go_main(cq: CallbackQuery, state: FSMContext):
     await cq.answer()
 
 # ---------- PDF Builder ----------
+STORE_WHATSAPP = "واتساب: +218928220151"
+
+# نصوص ثابتة تُشكَّل (reshape + bidi) مرة واحدة لكل عملية
+STATIC_TEXT = {
+    "title": "فاتورة السيراميك — إعمار البيوت",
+    "col_total": "الإجمالي",
+    "col_price": "السعر",
+    "col_qty": "الكمية",
+    "col_unit": "الوحدة",
+    "col_label": "البند",
+    "thanks": "شكراً لاختياركم إعمار البيوت للسيراميك والمواد الصحية — سبها",
+    "whatsapp": STORE_WHATSAPP,
+}
+
 def register_arabic_font() -> str:
     font_path = os.path.join("fonts", "Amiri-Regular.ttf")
     if os.path.exists(font_path):
@@ -520,97 +570,175 @@ def register_arabic_font() -> str:
             pass
     return "Helvetica"
 
-def draw_logo(c: canvas.Canvas, W: float, H: float, margin: float):
+def load_logo() -> Optional[ImageReader]:
     logo_path = os.path.join("assets", "logo.png")
     if os.path.exists(logo_path):
         try:
-            c.drawImage(logo_path, margin, H - margin - 1.5*cm, width=3.0*cm, height=1.5*cm,
-                        preserveAspectRatio=True, mask='auto')
+            logo = ImageReader(logo_path)
+            logo.getRGBData()  # فك الترميز الآن بدل كل فاتورة
+            return logo
         except Exception:
             pass
+    return None
+
+@dataclass
+class PdfResources:
+    font_name: str
+    logo: Optional[ImageReader]
+    text: Dict[str, str]
+
+_pdf_resources: Optional[PdfResources] = None
+_pdf_resources_lock = threading.Lock()
+
+def get_pdf_resources() -> PdfResources:
+    """Font, decoded logo and shaped static strings, initialised once per process."""
+    global _pdf_resources
+    if _pdf_resources is None:
+        with _pdf_resources_lock:
+            if _pdf_resources is None:
+                _pdf_resources = PdfResources(
+                    font_name=register_arabic_font(),
+                    logo=load_logo(),
+                    text={k: ar(v) for k, v in STATIC_TEXT.items()},
+                )
+    return _pdf_resources
+
+def draw_logo(c: canvas.Canvas, W: float, H: float, margin: float, logo: Optional[ImageReader] = None):
+    if logo is None:
+        return
+    try:
+        c.drawImage(logo, margin, H - margin - 1.5*cm, width=3.0*cm, height=1.5*cm,
+                    preserveAspectRatio=True, mask='auto')
+    except Exception:
+        pass
+
+def define_forms(c: canvas.Canvas, res: PdfResources, W: float, H: float, margin: float):
+    """Header, table column titles and footer text as form XObjects: stored once per
+    document and referenced on every page instead of being redrawn."""
+    font_name, t = res.font_name, res.text
+
+    # page header (absolute page coordinates)
+    c.beginForm("hdr")
+    c.setFont(font_name, 16)
+    c.setFillColor(colors.black)
+    c.drawRightString(W - margin, H - margin, t["title"])
+    draw_logo(c, W, H, margin, res.logo)
+    c.setLineWidth(1)
+    c.line(margin, H - margin - 0.8*cm, W - margin, H - margin - 0.8*cm)
+    c.endForm()
+
+    # table column titles, drawn relative to the current row (y = 0)
+    c.beginForm("cols", lowerx=0, lowery=-0.5*cm, upperx=W, uppery=0.5*cm)
+    c.setFont(font_name, 10)
+    c.setFillColor(colors.black)
+    c.drawRightString(W - margin, 0, t["col_total"])
+    c.drawRightString(W - margin - 3.0*cm, 0, t["col_price"])
+    c.drawRightString(W - margin - 5.5*cm, 0, t["col_qty"])
+    c.drawRightString(W - margin - 8.5*cm, 0, t["col_unit"])
+    c.drawRightString(W - margin - 10.5*cm, 0, t["col_label"])
+    c.setLineWidth(0.5)
+    c.line(margin, -0.35*cm, W - margin, -0.35*cm)
+    c.endForm()
+
+    # static footer lines, relative to the "thanks" line (y = 0)
+    c.beginForm("ftr", lowerx=0, lowery=-0.6*cm, upperx=W, uppery=0.5*cm)
+    c.setFont(font_name, 9)
+    c.setFillColor(colors.black)
+    c.drawRightString(W - margin, 0, t["thanks"])
+    c.drawRightString(W - margin, -0.3*cm, t["whatsapp"])
+    c.endForm()
+
+def draw_form_at(c: canvas.Canvas, name: str, y: float):
+    c.saveState()
+    c.translate(0, y)
+    c.doForm(name)
+    c.restoreState()
+
+def space_texts(space: SpaceInvoice) -> Dict[str, str]:
+    """Raw (unshaped) per-space strings drawn in the PDF."""
+    t = {
+        "name": space.name,
+        "total": f"إجمالي {space.name}: {space.total:.2f} د.ل",
+    }
+    if space.category in {"kitchen", "bath"}:
+        t["dims"] = f"المحيط: {space.perimeter_m} م | الارتفاع: {space.height_m} م"
+        t["areas"] = f"الحائط: {space.wall_area_m2} م² | الأرضية: {space.floor_area_m2} م²"
+    return t
 
 def build_pdf(spaces: List[SpaceInvoice]) -> bytes:
+    # shape all of the invoice's unique strings in one pass up front
+    texts = [space_texts(sp) for sp in spaces]
+    grand = sum(sp.total for sp in spaces)
+    grand_text = f"الإجمالي الكلي: {grand:.2f} د.ل"
+    shaped = ar_many(
+        [v for t in texts for v in t.values()]
+        + [x for sp in spaces for ln in sp.lines for x in (ln.unit, ln.label)]
+        + [grand_text]
+    )
+
     buf = io.BytesIO()
     c = canvas.Canvas(buf, pagesize=A4)
     W, H = A4
 
-    font_name = register_arabic_font()
+    res = get_pdf_resources()
+    font_name = res.font_name
     margin = 1.5 * cm
     y = H - margin
 
     c.setTitle("فاتورة السيراميك")
+    define_forms(c, res, W, H, margin)
 
     def header():
         nonlocal y
-        c.setFont(font_name, 16)
-        c.setFillColor(colors.black)
-        c.drawRightString(W - margin, y, ar("فاتورة السيراميك — إعمار البيوت"))
-        draw_logo(c, W, H, margin)
-        y -= 0.8 * cm
-        c.setLineWidth(1)
-        c.line(margin, y, W - margin, y)
-        y -= 0.5 * cm
+        c.doForm("hdr")
+        y -= 1.3 * cm
+
+    def table_header():
+        nonlocal y
+        draw_form_at(c, "cols", y)
+        y -= 0.65 * cm
 
-    def draw_space(space: SpaceInvoice):
+    def draw_space(space: SpaceInvoice, t: Dict[str, str]):
         nonlocal y
         if y < 5 * cm:
             c.showPage()
             y = H - margin
             header()
         c.setFont(font_name, 13)
-        c.drawRightString(W - margin, y, ar(space.name))
+        c.drawRightString(W - margin, y, shaped[t["name"]])
         y -= 0.5 * cm
         c.setFont(font_name, 10)
-        if space.category in {"kitchen", "bath"}:
-            c.drawRightString(W - margin, y, ar(f"المحيط: {space.perimeter_m} م | الارتفاع: {space.height_m} م"))
+        if "dims" in t:
+            c.drawRightString(W - margin, y, shaped[t["dims"]])
             y -= 0.4 * cm
-            c.drawRightString(W - margin, y, ar(f"الحائط: {space.wall_area_m2} م² | الأرضية: {space.floor_area_m2} م²"))
+            c.drawRightString(W - margin, y, shaped[t["areas"]])
             y -= 0.5 * cm
 
-        # table header
-        c.setFont(font_name, 10)
-        c.drawRightString(W - margin, y, ar("الإجمالي"))
-        c.drawRightString(W - margin - 3.0*cm, y, ar("السعر"))
-        c.drawRightString(W - margin - 5.5*cm, y, ar("الكمية"))
-        c.drawRightString(W - margin - 8.5*cm, y, ar("الوحدة"))
-        c.drawRightString(W - margin - 10.5*cm, y, ar("البند"))
-        y -= 0.35 * cm
-        c.setLineWidth(0.5)
-        c.line(margin, y, W - margin, y)
-        y -= 0.3 * cm
+        table_header()
 
         for ln in space.lines:
             if y < 3 * cm:
                 c.showPage()
                 y = H - margin
                 header()
-                c.setFont(font_name, 10)
-                c.drawRightString(W - margin, y, ar("الإجمالي"))
-                c.drawRightString(W - margin - 3.0*cm, y, ar("السعر"))
-                c.drawRightString(W - margin - 5.5*cm, y, ar("الكمية"))
-                c.drawRightString(W - margin - 8.5*cm, y, ar("الوحدة"))
-                c.drawRightString(W - margin - 10.5*cm, y, ar("البند"))
-                y -= 0.35 * cm
-                c.setLineWidth(0.5)
-                c.line(margin, y, W - margin, y)
-                y -= 0.3 * cm
+                table_header()
 
             c.setFont(font_name, 10)
             c.drawRightString(W - margin, y, f"{ln.total:.2f}")
             c.drawRightString(W - margin - 3.0*cm, y, f"{ln.price:.2f}")
             c.drawRightString(W - margin - 5.5*cm, y, f"{ln.qty}")
-            c.drawRightString(W - margin - 8.5*cm, y, ar(ln.unit))
-            c.drawRightString(W - margin - 10.5*cm, y, ar(ln.label))
+            c.drawRightString(W - margin - 8.5*cm, y, shaped[ln.unit])
+            c.drawRightString(W - margin - 10.5*cm, y, shaped[ln.label])
             y -= 0.32 * cm
 
         c.setLineWidth(0.5)
         c.line(margin, y, W - margin, y)
         y -= 0.3 * cm
         c.setFont(font_name, 11)
-        c.drawRightString(W - margin, y, ar(f"إجمالي {space.name}: {space.compute_totals():.2f} د.ل"))
+        c.drawRightString(W - margin, y, shaped[t["total"]])
         y -= 0.6 * cm
 
-    def footer(grand_total: float):
+    def footer():
         nonlocal y
         if y < 3.0 * cm:
             c.showPage()
@@ -621,21 +749,72 @@ def build_pdf(spaces: List[SpaceInvoice]) -> bytes:
         y -= 0.5 * cm
         c.setFont(font_name, 14)
         c.setFillColor(colors.darkblue)
-        c.drawRightString(W - margin, y, ar(f"الإجمالي الكلي: {grand_total:.2f} د.ل"))
+        c.drawRightString(W - margin, y, shaped[grand_text])
         c.setFillColor(colors.black)
         y -= 0.8 * cm
-        c.setFont(font_name, 9)
-        c.drawRightString(W - margin, y, ar("شكراً لاختياركم إعمار البيوت للسيراميك والمواد الصحية — سبها"))
+        draw_form_at(c, "ftr", y)
         y -= 0.3 * cm
-        c.drawRightString(W - margin, y, ar("واتساب: +218928220151"))
 
     header()
-    grand = 0.0
-    for sp in spaces:
-        draw_space(sp)
-        grand += sp.compute_totals()
-    footer(grand)
+    for sp, t in zip(spaces, texts):
+        draw_space(sp, t)
+    footer()
 
     c.save()
     buf.seek(0)
     return buf.read()
+
+# ---------- Invoice cache ----------
+invoice_cache = InvoiceCache(max_bytes=INVOICE_CACHE_MB * 1024 * 1024)
+
+def invoice_key(spaces: List[SpaceInvoice]) -> str:
+    """Canonical content hash of an invoice: its spaces, the pricing constants and
+    the PDF layout version."""
+    payload = {
+        "v": PDF_LAYOUT_VERSION,
+        "prices": price_catalog.prices().to_tuple(),
+        "spaces": [sp.to_tuple() for sp in spaces],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+_pdf_pool: Optional[Executor] = None
+_pdf_slots: Optional[asyncio.Semaphore] = None
+
+def get_pdf_pool() -> Executor:
+    """Thread pool by default; PDF_EXECUTOR=process sidesteps the GIL for heavy loads
+    (SpaceInvoice/Line are plain module-level dataclasses, so they pickle)."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        if PDF_EXECUTOR == "process":
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        else:
+            _pdf_pool = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf")
+    return _pdf_pool
+
+async def render_pdf(spaces: List[SpaceInvoice]) -> bytes:
+    """Run build_pdf off the event loop, at most PDF_MAX_CONCURRENT at a time.
+    Raises asyncio.TimeoutError after PDF_TIMEOUT seconds (queueing included).
+
+    The timeout only stops the caller waiting: the executor keeps rendering, so the slot
+    is held until the render really finishes, otherwise timed-out jobs (and the user's
+    retries) would pile up in the pool beyond PDF_MAX_CONCURRENT."""
+    global _pdf_slots
+    if _pdf_slots is None:
+        _pdf_slots = asyncio.Semaphore(PDF_MAX_CONCURRENT)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PDF_TIMEOUT
+    await asyncio.wait_for(_pdf_slots.acquire(), PDF_TIMEOUT)
+    try:
+        future = loop.run_in_executor(get_pdf_pool(), build_pdf, list(spaces))
+    except BaseException:
+        _pdf_slots.release()
+        raise
+
+    def done(f: asyncio.Future) -> None:
+        _pdf_slots.release()
+        if not f.cancelled():
+            f.exception()  # mark retrieved when the caller already timed out
+
+    future.add_done_callback(done)
+    return await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - loop.time()))
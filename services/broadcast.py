@@ -0,0 +1,189 @@
+# services/broadcast.py
+# البث للمشتركين: سجل المحادثات (SQLite) + مُرسل بمعدل عام محدود (~30 رسالة/ث عند تيليجرام)،
+# يعيد المحاولة عند RetryAfter، يحذف من حظر البوت، ويحفظ مؤشر التقدّم بعد كل دفعة
+# فيُستأنف البث المقطوع من حيث توقف.
+import json
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from services.sqlite_util import connect
+from services.uploader import AdaptiveRateLimiter
+
+
+class SubscriberRegistry:
+    def __init__(self, path: str):
+        self._db = connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS subscribers ("
+            "chat_id INTEGER PRIMARY KEY, first_seen REAL NOT NULL, last_seen REAL NOT NULL, "
+            "active INTEGER NOT NULL DEFAULT 1)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'running', cursor INTEGER NOT NULL DEFAULT 0, "
+            "total INTEGER NOT NULL DEFAULT 0, sent INTEGER NOT NULL DEFAULT 0, "
+            "failed INTEGER NOT NULL DEFAULT 0, removed INTEGER NOT NULL DEFAULT 0, "
+            "admin_chat INTEGER)"
+        )
+
+    # ---------- المشتركون ----------
+    def add(self, chat_id: int) -> None:
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO subscribers (chat_id, first_seen, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET last_seen = excluded.last_seen, active = 1",
+            (chat_id, now, now),
+        )
+
+    def deactivate(self, chat_ids: List[int]) -> None:
+        if chat_ids:
+            self._db.executemany("UPDATE subscribers SET active = 0 WHERE chat_id = ?", [(c,) for c in chat_ids])
+
+    def active_after(self, cursor: int, limit: int) -> List[int]:
+        """دفعة مرتبة حسب chat_id بعد المؤشر — ثابتة بين الاستئنافات."""
+        rows = self._db.execute(
+            "SELECT chat_id FROM subscribers WHERE active = 1 AND chat_id > ? ORDER BY chat_id LIMIT ?",
+            (cursor, limit),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM subscribers WHERE active = 1").fetchone()[0]
+
+    # ---------- سجل البث ----------
+    def create_broadcast(self, payload: Dict[str, Any], admin_chat: Optional[int]) -> int:
+        cur = self._db.execute(
+            "INSERT INTO broadcasts (created, payload, total, admin_chat) VALUES (?, ?, ?, ?)",
+            (time.time(), json.dumps(payload, ensure_ascii=False), self.count(), admin_chat),
+        )
+        return cur.lastrowid
+
+    def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        cur = self._db.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        b = dict(zip([d[0] for d in cur.description], row))
+        b["payload"] = json.loads(b["payload"])
+        return b
+
+    def running(self) -> List[int]:
+        return [r[0] for r in self._db.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")]
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT MAX(id) FROM broadcasts").fetchone()
+        return self.get_broadcast(row[0]) if row and row[0] else None
+
+    def checkpoint(self, broadcast_id: int, cursor: int, sent: int, failed: int, removed: int,
+                   status: str = "running") -> None:
+        self._db.execute(
+            "UPDATE broadcasts SET cursor = ?, sent = ?, failed = ?, removed = ?, status = ? WHERE id = ?",
+            (cursor, sent, failed, removed, status, broadcast_id),
+        )
+
+
+Progress = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Broadcaster:
+    """يرسل بثًا واحدًا في كل مرة: دفعات من batch_size محادثة، وداخل الدفعة عمّال متوازيون
+    يتشاركون محدد المعدل. كل محادثة تتلقى رسالة واحدة فقط، فحد المحادثة الواحدة لا يُتجاوز."""
+
+    def __init__(self, bot: Bot, registry: SubscriberRegistry, *, rate: float = 25.0,
+                 concurrency: int = 20, batch_size: int = 250, max_retries: int = 5):
+        self.bot = bot
+        self.registry = registry
+        self.rate = rate
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.current: Optional[int] = None
+        self._cancel = False
+
+    def cancel(self) -> bool:
+        if self.current is None:
+            return False
+        self._cancel = True
+        return True
+
+    async def _send(self, chat_id: int, payload: Dict[str, Any]) -> None:
+        if payload.get("photo"):
+            await self.bot.send_photo(chat_id, photo=payload["photo"], caption=payload.get("caption"))
+        else:
+            await self.bot.send_message(chat_id, payload["text"], disable_web_page_preview=True)
+
+    async def run(self, broadcast_id: int, on_progress: Optional[Progress] = None) -> Dict[str, Any]:
+        b = self.registry.get_broadcast(broadcast_id)
+        if b is None or b["status"] != "running":
+            return b or {}
+        self.current, self._cancel = broadcast_id, False
+        # معدل ثابت قريب من الحد: نبدأ منه مباشرة، وننصفه مؤقتًا فقط عند RetryAfter
+        limiter = AdaptiveRateLimiter(rate=self.rate, min_rate=1.0, max_rate=self.rate,
+                                      increase=1.0, burst=self.rate / 5)
+        payload = b["payload"]
+        cursor, counts = b["cursor"], {"sent": b["sent"], "failed": b["failed"], "removed": b["removed"]}
+        try:
+            while not self._cancel:
+                batch = await asyncio.to_thread(self.registry.active_after, cursor, self.batch_size)
+                if not batch:
+                    break
+                blocked = await self._send_batch(batch, payload, limiter, counts)
+                await asyncio.to_thread(self.registry.deactivate, blocked)
+                cursor = batch[-1]
+                await asyncio.to_thread(self.registry.checkpoint, broadcast_id, cursor, **counts)
+                if on_progress:
+                    await on_progress({**b, "cursor": cursor, **counts})
+            status = "cancelled" if self._cancel else "done"
+            await asyncio.to_thread(self.registry.checkpoint, broadcast_id, cursor, status=status, **counts)
+            return {**b, "cursor": cursor, "status": status, **counts}
+        finally:
+            self.current = None
+
+    async def _send_batch(self, batch: List[int], payload: Dict[str, Any],
+                          limiter: AdaptiveRateLimiter, counts: Dict[str, int]) -> List[int]:
+        queue: "asyncio.Queue[int]" = asyncio.Queue()
+        for chat_id in batch:
+            queue.put_nowait(chat_id)
+        blocked: List[int] = []
+
+        async def send_one(chat_id: int) -> None:
+            for _ in range(self.max_retries):
+                await limiter.acquire()
+                try:
+                    await self._send(chat_id, payload)
+                except TelegramRetryAfter as e:
+                    limiter.on_retry_after(e.retry_after)
+                    continue
+                except TelegramForbiddenError:
+                    blocked.append(chat_id)  # حظر البوت أو حساب محذوف
+                    counts["removed"] += 1
+                    return
+                except TelegramBadRequest as e:
+                    if "chat not found" in str(e).lower():
+                        blocked.append(chat_id)
+                        counts["removed"] += 1
+                    else:
+                        counts["failed"] += 1
+                    return
+                except Exception:
+                    counts["failed"] += 1
+                    return
+                counts["sent"] += 1
+                return
+            counts["failed"] += 1
+
+        async def worker() -> None:
+            while not self._cancel:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await send_one(chat_id)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(self.concurrency, len(batch))))))
+        return blocked
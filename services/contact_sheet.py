@@ -0,0 +1,93 @@
+# services/contact_sheet.py
+# ورقة معاينة (contact sheet): شبكة مصغّرات مع رقم كل عرض في صورة واحدة، تُولَّد بـ Pillow
+# مرة واحدة ثم يُحفظ file_id الخاص بها. المفتاح بصمة (الأكواد + file_id + التخطيط)،
+# فتُولَّد من جديد تلقائيًا فقط عندما تتغير صفحة بعد الأرشفة.
+import io
+import os
+import json
+import hashlib
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from services.fileio import atomic_write_json
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Pillow اختياري: بدونه يبقى وضع الألبوم فقط
+    Image = ImageDraw = ImageFont = None
+
+Source = Union[str, bytes]  # مسار ملف محلي أو محتوى الصورة
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def sheet_key(entries: Sequence[Tuple[str, str]], layout: str) -> str:
+    h = hashlib.sha1(layout.encode())
+    for code, file_id in entries:
+        h.update(f"{code}={file_id};".encode())
+    return h.hexdigest()
+
+
+def render_contact_sheet(tiles: Sequence[Tuple[str, Source]], *, cols: int = 5, thumb: int = 240,
+                         font_path: Optional[str] = None, quality: int = 85) -> bytes:
+    """شبكة cols أعمدة من مصغّرات thumb×thumb مع الكود تحت كل صورة → JPEG."""
+    if Image is None:
+        raise RuntimeError("Pillow غير مثبت")
+    pad, label_h = 6, max(18, thumb // 7)
+    rows = -(-len(tiles) // cols)
+    sheet = Image.new("RGB", (pad + cols * (thumb + pad), pad + rows * (thumb + label_h + pad)), "white")
+    draw = ImageDraw.Draw(sheet)
+    if font_path and os.path.exists(font_path):
+        font = ImageFont.truetype(font_path, label_h * 2 // 3)
+    else:
+        font = ImageFont.load_default()
+    for i, (code, src) in enumerate(tiles):
+        x = pad + (i % cols) * (thumb + pad)
+        y = pad + (i // cols) * (thumb + label_h + pad)
+        try:
+            with Image.open(src if isinstance(src, str) else io.BytesIO(src)) as im:
+                # JPEG يُفك مباشرة بدقة مخفّضة (الأصول ~8000px) بدل تحميل الصورة كاملة
+                im.draft("RGB", (thumb, thumb))
+                im = im.convert("RGB")
+                im.thumbnail((thumb, thumb))
+                sheet.paste(im, (x + (thumb - im.width) // 2, y + (thumb - im.height) // 2))
+        except (OSError, ValueError):
+            draw.rectangle((x, y, x + thumb - 1, y + thumb - 1), fill="#e5e5e5")  # صورة تالفة/غير متاحة
+        draw.text((x + thumb / 2, y + thumb + label_h / 2), code, fill="black", font=font, anchor="mm")
+    out = io.BytesIO()
+    sheet.save(out, "JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+class SheetCache:
+    """بصمة الصفحة → file_id في ملف JSON صغير (أحدث max_entries فقط)."""
+
+    def __init__(self, path: str, max_entries: int = 200):
+        self.path = path
+        self.max_entries = max_entries
+        self._data: Optional[Dict[str, str]] = None
+
+    def _load(self) -> Dict[str, str]:
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key: str) -> Optional[str]:
+        return self._load().get(key)
+
+    def put(self, key: str, file_id: str) -> None:
+        data = self._load()
+        data.pop(key, None)
+        data[key] = file_id
+        while len(data) > self.max_entries:
+            data.pop(next(iter(data)))
+        atomic_write_json(self.path, data, indent=2)
+
+    def discard(self, key: str) -> None:
+        if self._load().pop(key, None) is not None:
+            atomic_write_json(self.path, self._data, indent=2)
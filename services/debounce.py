@@ -0,0 +1,45 @@
+# services/debounce.py
+# دمج الضغطات المتتالية لكل مفتاح (مثل رسالة واحدة): كل طلب جديد يلغي السابق —
+# سواء كان ينتظر مهلة التأخير أو قيد التنفيذ — فلا يُنفَّذ إلا آخر هدف.
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class Debouncer:
+    def __init__(self, delay: float = 0.25):
+        self.delay = delay
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._targets: Dict[Hashable, Any] = {}
+
+    def target(self, key: Hashable) -> Optional[Any]:
+        """آخر هدف مطلوب لم يكتمل تنفيذه بعد (None إن لم يوجد)."""
+        return self._targets.get(key)
+
+    def cancel(self, key: Hashable) -> None:
+        task = self._tasks.pop(key, None)
+        self._targets.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    def submit(self, key: Hashable, value: Any, action: Callable[[Any], Awaitable[None]]) -> None:
+        """جدولة action(value) بعد delay، مع إلغاء أي عمل سابق لنفس المفتاح."""
+        old = self._tasks.pop(key, None)
+        if old is not None:
+            old.cancel()
+        self._targets[key] = value
+
+        async def run() -> None:
+            try:
+                await asyncio.sleep(self.delay)
+                await action(value)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ debounce {key}: {e}")
+            finally:
+                if self._tasks.get(key) is task:
+                    del self._tasks[key]
+                    self._targets.pop(key, None)
+
+        task = asyncio.create_task(run())
+        self._tasks[key] = task
@@ -0,0 +1,99 @@
+# services/dedup.py
+# نافذة update_id المستلمة مؤخرًا: تُسقط إعادة إرسال تيليجرام لنفس التحديث قبل أي معالجة.
+# الذاكرة محدودة (عدد أقصى + مدة صلاحية)، ويمكن مشاركتها بين العمّال عبر ملف SQLite محلي.
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from services.sqlite_util import connect
+
+
+class MemorySeenUpdates:
+    """نافذة داخل العملية: OrderedDict مرتب حسب وقت الاستلام."""
+
+    def __init__(self, ttl: float = 3600.0, maxlen: int = 10000):
+        self.ttl = ttl
+        self.maxlen = maxlen
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+
+    def seen(self, update_id: int) -> bool:
+        """True إذا سبق استلام التحديث؛ وإلا يُسجَّل ويعيد False."""
+        now = time.monotonic()
+        self._evict(now)
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = now
+        return False
+
+    def forget(self, update_id: int) -> None:
+        """إلغاء التسجيل (مثلًا عند رفض التحديث لنقبل إعادة إرساله)."""
+        self._seen.pop(update_id, None)
+
+    def _evict(self, now: float) -> None:
+        cutoff = now - self.ttl
+        while self._seen:
+            oldest_id, ts = next(iter(self._seen.items()))
+            if ts >= cutoff and len(self._seen) < self.maxlen:
+                break
+            del self._seen[oldest_id]
+
+
+class SqliteSeenUpdates:
+    """نافذة مشتركة بين عمّال uvicorn عبر ملف SQLite (مفتاح أساسي = update_id)."""
+
+    def __init__(self, path: str, ttl: float = 3600.0, maxlen: int = 10000, sweep_every: float = 30.0):
+        self.ttl = ttl
+        self.maxlen = maxlen
+        self.sweep_every = sweep_every
+        self._last_sweep = 0.0
+        self._db = connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen_updates ("
+            "update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+
+    def seen(self, update_id: int) -> bool:
+        now = time.time()
+        if now - self._last_sweep >= self.sweep_every:
+            self._sweep(now)
+        cur = self._db.execute(
+            "INSERT OR IGNORE INTO seen_updates (update_id, seen_at) VALUES (?, ?)",
+            (update_id, now),
+        )
+        if cur.rowcount:
+            return False
+        # سجل قديم لم يُحذف بعد لا يُعتبر تكرارًا
+        row = self._db.execute(
+            "SELECT seen_at FROM seen_updates WHERE update_id = ?", (update_id,)
+        ).fetchone()
+        if row and row[0] < now - self.ttl:
+            self._db.execute(
+                "UPDATE seen_updates SET seen_at = ? WHERE update_id = ?", (now, update_id)
+            )
+            return False
+        return True
+
+    def forget(self, update_id: int) -> None:
+        self._db.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+
+    def _sweep(self, now: float) -> None:
+        self._last_sweep = now
+        self._db.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM seen_updates WHERE update_id <= ("
+            "SELECT update_id FROM seen_updates ORDER BY update_id DESC LIMIT 1 OFFSET ?)",
+            (self.maxlen,),
+        )
+
+
+def make_seen_updates() -> Optional[object]:
+    """اختيار الخلفية من البيئة: DEDUP_BACKEND = memory | sqlite | off."""
+    backend = os.getenv("DEDUP_BACKEND", "memory").strip().lower()
+    ttl = float(os.getenv("DEDUP_TTL", "3600"))
+    maxlen = int(os.getenv("DEDUP_MAX", "10000"))
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return SqliteSeenUpdates(os.getenv("DEDUP_DB_PATH", "data/updates.sqlite3"), ttl=ttl, maxlen=maxlen)
+    return MemorySeenUpdates(ttl=ttl, maxlen=maxlen)
@@ -0,0 +1,86 @@
+# services/digest.py
+# تجميع إشعارات المدير: بدل رسالة لكل حدث، تُرسل رسالة ملخّص واحدة كل interval ثانية
+# (أو فورًا عند بلوغ max_items)، مقسّمة حسب حد طول رسالة تيليجرام.
+# العناصر نص خام؛ التهريب (HTML) يتم هنا بعد القص حتى لا يُشطر كيان مثل &amp;.
+import html
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+TELEGRAM_TEXT_LIMIT = 4096
+
+
+def escape_truncated(text: str, limit: int) -> str:
+    """html.escape لأطول بادئة من النص الخام لا يتجاوز ناتجها limit حرفًا."""
+    out, size = [], 0
+    for ch in text[:max(limit, 0)]:
+        escaped = html.escape(ch)
+        size += len(escaped)
+        if size > limit:
+            break
+        out.append(escaped)
+    return "".join(out)
+
+
+class DigestNotifier:
+    def __init__(self, send: Callable[[str], Awaitable[None]], title: str,
+                 interval: float = 300.0, max_items: int = 20):
+        self.send = send
+        self.title = title
+        self.interval = interval
+        self.max_items = max_items
+        self._items: List[str] = []
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def add(self, text: str) -> None:
+        self._items.append(text)
+        if len(self._items) >= self.max_items:
+            self._wake.set()
+
+    def _messages(self, items: List[str]) -> List[str]:
+        header = f"{html.escape(self.title)} ({len(items)}):"
+        messages, current = [], header
+        for item in items:
+            block = "\n\n" + html.escape(item)
+            if len(current) + len(block) > TELEGRAM_TEXT_LIMIT and current != header:
+                messages.append(current)
+                current = header + " (تابع)"
+            if len(current) + len(block) > TELEGRAM_TEXT_LIMIT:
+                block = "\n\n" + escape_truncated(item, TELEGRAM_TEXT_LIMIT - len(current) - 2)
+            current += block
+        messages.append(current)
+        return messages
+
+    async def flush(self) -> None:
+        if not self._items:
+            return
+        items, self._items = self._items, []
+        for text in self._messages(items):
+            try:
+                await self.send(text)
+            except Exception as e:
+                print(f"⚠️ digest: فشل إرسال الملخص: {e}")
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        await self.flush()
@@ -0,0 +1,120 @@
+# services/file_check.py
+# فحص صلاحية file_id المخزّنة عبر getFile (بدون تنزيل المحتوى) بتوازي محدود ومعدل محدود،
+# لاكتشاف المعرّفات التالفة قبل أن يصادفها العميل أثناء التصفح.
+import os
+import json
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from services.fileio import atomic_write_json
+from services.uploader import AdaptiveRateLimiter
+
+# (code, file_id)
+FileItem = Tuple[str, str]
+
+
+async def verify_file_ids(
+    bot: Bot,
+    items: List[FileItem],
+    *,
+    concurrency: int = 4,
+    limiter: Optional[AdaptiveRateLimiter] = None,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    max_retries: int = 5,
+) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """يعيد (التالفة، غير المحسومة) كقوائم (code, سبب).
+
+    التالف: رفض تيليجرام للمعرّف نفسه. غير المحسوم: خطأ شبكة/خادم — يُعاد فحصه في الدورة التالية
+    بدل إعادة رفع صورة سليمة."""
+    limiter = limiter or AdaptiveRateLimiter()
+    broken: List[Tuple[str, str]] = []
+    unknown: List[Tuple[str, str]] = []
+    queue: "asyncio.Queue[FileItem]" = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    total = len(items)
+    checked = 0
+
+    async def check_one(code: str, file_id: str) -> None:
+        for _ in range(max_retries):
+            await limiter.acquire()
+            try:
+                await bot.get_file(file_id)
+            except TelegramRetryAfter as e:
+                limiter.on_retry_after(e.retry_after)
+                continue
+            except TelegramBadRequest as e:
+                if "too big" not in str(e).lower():  # >20MB: المعرّف صالح لكن لا يُنزَّل عبر getFile
+                    broken.append((code, str(e)))
+                return
+            except Exception as e:
+                unknown.append((code, str(e)))
+                return
+            limiter.on_success()
+            return
+        unknown.append((code, "تجاوز عدد محاولات FloodWait"))
+
+    async def worker() -> None:
+        nonlocal checked
+        while True:
+            try:
+                code, file_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await check_one(code, file_id)
+            checked += 1
+            if on_progress:
+                await on_progress(checked, total)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    return broken, unknown
+
+
+class BrokenFileIds:
+    """code → file_id رفضه تيليجرام، في ملف JSON صغير يُعاد تحميله عند تغيّر mtime (عدة عمّال).
+    الكود تالف فقط ما دام file_id الحالي هو المسجّل، فإعادة أرشفته تلغي العلامة تلقائيًا."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Dict[str, str] = {}
+        self._mtime: Optional[float] = None
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            data: Dict[str, str] = {}
+            if mtime is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    data = {}
+            self._data, self._mtime = data, mtime
+        return self._data
+
+    def is_broken(self, code: str, file_id: str) -> bool:
+        return self._load().get(code) == file_id
+
+    def _save(self, data: Dict[str, str]) -> None:
+        atomic_write_json(self.path, data, indent=2, sort_keys=True)
+        self._data, self._mtime = data, os.stat(self.path).st_mtime
+
+    def mark(self, items: Iterable[FileItem]) -> None:
+        data = dict(self._load())
+        before = dict(data)
+        data.update(items)
+        if data != before:
+            self._save(data)
+
+    def prune(self, current: Dict[str, str]) -> None:
+        """حذف العلامات التي لم تعد تطابق file_id الحالي (أُعيدت أرشفتها أو حُذفت)."""
+        data = self._load()
+        kept = {c: fid for c, fid in data.items() if current.get(c) == fid}
+        if len(kept) != len(data):
+            self._save(kept)
@@ -0,0 +1,67 @@
+# services/fileio.py
+# كتابة ملفات JSON بشكل ذرّي: ملف مؤقت في نفس المجلد + fsync + os.replace،
+# فإما أن يبقى الملف القديم كاملًا أو يظهر الجديد كاملًا — لا ملف نصف مكتوب بعد انقطاع.
+import os
+import json
+import tempfile
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # ويندوز
+    fcntl = None
+
+
+def atomic_write_json(path: str, data: Any, **dump_kwargs: Any) -> None:
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    dump_kwargs.setdefault("ensure_ascii", False)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # تثبيت عملية إعادة التسمية نفسها على القرص (POSIX)
+        dir_fd = os.open(folder, os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class FileLock:
+    """قفل حصري غير حاجب بين العمليات (fcntl على POSIX)، حتى لا تكرر عدة عمليات
+    (عمّال uvicorn مثلًا) نفس المهمة الدورية. بدون fcntl (ويندوز) يُقبل دائمًا."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def acquire(self, blocking: bool = False) -> bool:
+        """blocking=True ينتظر القفل بدل الرفض (لأقسام قصيرة مثل إلحاق دفعة بملف مشترك)."""
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
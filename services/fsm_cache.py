@@ -0,0 +1,107 @@
+# services/fsm_cache.py
+# وحدة عمل (unit of work) لحالة FSM لكل تحديث: تُقرأ البيانات من التخزين مرة واحدة،
+# وتُخدم كل قراءات/تعديلات المعالج من الذاكرة، ثم تُكتب التغييرات مرة واحدة في النهاية.
+# التحديثات المتزامنة لنفس المفتاح (ضغطتان سريعتان في وضع inline) تُسلسل بقفل لكل مفتاح،
+# وإلا يقرأ كلاهما نفس النسخة ويمحو آخرُ من يكتب تعديلات الآخر.
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+
+class CachedFSMContext(FSMContext):
+    """FSMContext يحتفظ بالحالة والبيانات داخل التحديث الحالي ولا يكتب إلا عند flush()."""
+
+    def __init__(self, storage: BaseStorage, key: StorageKey, raw_state: Optional[str] = None):
+        super().__init__(storage=storage, key=key)
+        self._state = raw_state  # FSMContextMiddleware قرأها مسبقًا
+        self._data: Optional[Dict[str, Any]] = None
+        self._state_dirty = False
+        self._data_dirty = False
+
+    async def _loaded(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+        return self._data
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_dirty = True
+
+    async def get_state(self) -> Optional[str]:
+        return self._state
+
+    async def set_data(self, data: Mapping[str, Any]) -> None:
+        self._data = dict(data)
+        self._data_dirty = True
+
+    async def get_data(self) -> Dict[str, Any]:
+        return dict(await self._loaded())
+
+    async def get_value(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        return (await self._loaded()).get(key, default)
+
+    async def update_data(self, data: Optional[Mapping[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        current = await self._loaded()
+        if data:
+            kwargs.update(data)
+        current.update(kwargs)
+        self._data_dirty = True
+        return dict(current)
+
+    async def clear(self) -> None:
+        await self.set_state(None)
+        await self.set_data({})
+
+    async def flush(self) -> None:
+        set_record = getattr(self.storage, "set_record", None)  # SQLiteStorage: كتابة ذرّية واحدة
+        if self._state_dirty and self._data_dirty and set_record is not None:
+            await set_record(key=self.key, state=self._state, data=self._data or {})
+            self._state_dirty = self._data_dirty = False
+            return
+        if self._state_dirty:
+            await self.storage.set_state(key=self.key, state=self._state)
+            self._state_dirty = False
+        if self._data_dirty:
+            await self.storage.set_data(key=self.key, data=self._data or {})
+            self._data_dirty = False
+
+
+class FSMUnitOfWorkMiddleware(BaseMiddleware):
+    """يُسجَّل كـ outer middleware على dp.update بعد FSMContextMiddleware الافتراضي."""
+
+    def __init__(self) -> None:
+        # StorageKey → [القفل، عدد المنتظرين/المستخدمين] (يُحذف عند الصفر)
+        self._locks: Dict[StorageKey, List[Any]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        context = data.get("state")
+        if context is None or isinstance(context, CachedFSMContext):
+            return await handler(event, data)
+        entry = self._locks.setdefault(context.key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            waited = entry[0].locked()
+            async with entry[0]:
+                if waited:
+                    # raw_state قُرئ قبل انتظار القفل؛ التحديث السابق ربما غيّره
+                    data["raw_state"] = await context.get_state()
+                cached = CachedFSMContext(context.storage, context.key, data.get("raw_state"))
+                data["state"] = cached
+                result = await handler(event, data)
+                # الكتابة عند النجاح فقط: لا نحفظ بيانات نصف معدّلة من معالج فشل
+                await cached.flush()
+                return result
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[context.key]
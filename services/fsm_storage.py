@@ -0,0 +1,116 @@
+# services/fsm_storage.py
+# تخزين حالات FSM في SQLite محلي (WAL): يبقى بعد إعادة التشغيل ويُشارك بين عمّال uvicorn.
+# البيانات تُحفظ JSON مضغوطًا، والجلسات الخاملة تُحذف بعد مدة (TTL)،
+# مع ذاكرة ساخنة صغيرة داخل العملية تُبطَل تلقائيًا عند كتابة عملية أخرى.
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from services.sqlite_util import connect
+
+
+def _dumps(data: Mapping[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, hot_size: int = 1024,
+                 sweep_every: float = 300.0, key_builder: Optional[KeyBuilder] = None):
+        self.ttl = ttl
+        self.hot_size = hot_size
+        self.sweep_every = sweep_every
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._db = connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}', "
+            "updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at)")
+        # key → (state, data)؛ None يعني "لا يوجد سجل"
+        self._hot: "OrderedDict[str, Tuple[Optional[str], Dict[str, Any]]]" = OrderedDict()
+        self._data_version = self._version()
+        self._last_sweep = 0.0
+        self._closed = False
+
+    # ---------- hot cache ----------
+    def _version(self) -> int:
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load(self, k: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        # data_version يتغير فقط إذا كتبت عملية/اتصال آخر؛ عندها نفرغ الذاكرة الساخنة
+        version = self._version()
+        if version != self._data_version:
+            self._data_version = version
+            self._hot.clear()
+        cached = self._hot.get(k)
+        if cached is not None:
+            self._hot.move_to_end(k)
+            return cached
+        row = self._db.execute("SELECT state, data FROM fsm WHERE key = ?", (k,)).fetchone()
+        record = (row[0], json.loads(row[1])) if row else (None, {})
+        self._remember(k, record)
+        return record
+
+    def _remember(self, k: str, record: Tuple[Optional[str], Dict[str, Any]]) -> None:
+        self._hot[k] = record
+        self._hot.move_to_end(k)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _store(self, k: str, state: Optional[str], data: Dict[str, Any]) -> None:
+        now = time.time()
+        if state is None and not data:
+            self._db.execute("DELETE FROM fsm WHERE key = ?", (k,))
+        else:
+            self._db.execute(
+                "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                (k, state, _dumps(data), now),
+            )
+        self._remember(k, (state, data))
+        if now - self._last_sweep >= self.sweep_every:
+            self.sweep(now)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """حذف الجلسات التي لم تُكتب منذ أكثر من ttl ثانية."""
+        now = time.time() if now is None else now
+        self._last_sweep = now
+        cur = self._db.execute("DELETE FROM fsm WHERE updated_at < ?", (now - self.ttl,))
+        if cur.rowcount:
+            self._hot.clear()
+        return cur.rowcount
+
+    # ---------- BaseStorage ----------
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        _, data = self._load(k)
+        self._store(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._load(self.key_builder.build(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = self.key_builder.build(key)
+        state, _ = self._load(k)
+        self._store(k, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(self._load(self.key_builder.build(key))[1])
+
+    async def set_record(self, key: StorageKey, state: StateType, data: Mapping[str, Any]) -> None:
+        """الحالة والبيانات معًا في عبارة واحدة (صف واحد)، فلا يفصل انقطاع التشغيل بين نصفيهما."""
+        self._store(self.key_builder.build(key), state.state if isinstance(state, State) else state, dict(data))
+
+    async def close(self) -> None:
+        """آمنة للتكرار: يغلقها خطاف dp.shutdown في aiogram وإغلاق lifespan الصريح."""
+        if self._closed:
+            return
+        self._closed = True
+        self._hot.clear()
+        self._db.close()
@@ -0,0 +1,99 @@
+# services/image_manifest.py
+# بيان (manifest) لصور المجلد: الحجم + mtime + بصمة sha256 + file_id لكل كود،
+# لتحديد الجديد/المتغيّر/المحذوف بدقة وإعادة رفع ما تغيّر فقط.
+import os
+import json
+import asyncio
+import hashlib
+from typing import Dict, List, Tuple
+
+from services.fileio import atomic_write_json
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+# code → {"file", "size", "mtime", "sha256", "file_id"}
+Manifest = Dict[str, dict]
+
+
+def load_manifest(path: str) -> Manifest:
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ manifest: تعذّر قراءة {path}: {e}")
+    return {}
+
+
+def save_manifest(path: str, manifest: Manifest) -> None:
+    atomic_write_json(path, manifest, indent=2, sort_keys=True)
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def scan_images(images_dir: str, manifest: Manifest) -> Manifest:
+    """وصف الصور الحالية في المجلد. البصمة تُعاد حسابها فقط إذا تغيّر الحجم أو mtime،
+    والحساب يتم في مجمّع الخيوط حتى لا يتجمّد الـ event loop مع المجلدات الكبيرة."""
+    if not os.path.isdir(images_dir):
+        return {}
+    files = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTS))
+    current: Manifest = {}
+    to_hash: List[Tuple[str, str]] = []
+    for fname in files:
+        code = os.path.splitext(fname)[0]
+        if code in current:
+            continue  # نفس الكود بامتدادين: نأخذ الأول أبجديًا
+        st = os.stat(os.path.join(images_dir, fname))
+        entry = {"file": fname, "size": st.st_size, "mtime": st.st_mtime}
+        prev = manifest.get(code)
+        if prev and prev.get("file") == fname and prev.get("size") == st.st_size \
+                and prev.get("mtime") == st.st_mtime and prev.get("sha256"):
+            entry["sha256"] = prev["sha256"]
+        else:
+            to_hash.append((code, os.path.join(images_dir, fname)))
+        current[code] = entry
+
+    hashes = await asyncio.gather(*(asyncio.to_thread(hash_file, p) for _, p in to_hash))
+    for (code, _), digest in zip(to_hash, hashes):
+        current[code]["sha256"] = digest
+    return current
+
+
+def plan_changes(current: Manifest, manifest: Manifest, offers: Dict[str, str]):
+    """يعيد (جديد، متغيّر، محذوف، دون تغيير) كقوائم أكواد مرتبة.
+
+    كود موجود في JSON بلا سجل في البيان (أرشفة سابقة للبيان) يُعتبر مطابقًا
+    ويُتبنّى file_id الحالي بدل إعادة رفعه."""
+    new, changed, unchanged = [], [], []
+    for code, entry in current.items():
+        if code not in offers:
+            new.append(code)
+            continue
+        prev = manifest.get(code)
+        if prev is None or prev.get("sha256") == entry["sha256"]:
+            unchanged.append(code)
+        else:
+            changed.append(code)
+    deleted = sorted(c for c in offers if c not in current)
+    return new, changed, deleted, unchanged
+
+
+def build_manifest(current: Manifest, manifest: Manifest,
+                   result_map: Dict[str, str], uploaded: Dict[str, str]) -> Manifest:
+    """البيان الجديد: المرفوع يأخذ وصفه الحالي، والمُبقى عليه يُحدَّث فقط إذا طابقت بصمته،
+    وإلا يبقى سجله القديم حتى تُعاد محاولة رفعه في المرة القادمة."""
+    out: Manifest = {}
+    for code, file_id in result_map.items():
+        entry = current.get(code)
+        prev = manifest.get(code)
+        if code in uploaded or (entry and (prev is None or prev.get("sha256") == entry["sha256"])):
+            out[code] = {**entry, "file_id": file_id}
+        elif prev is not None:
+            out[code] = prev
+    return out
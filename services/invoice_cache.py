@@ -0,0 +1,59 @@
+# services/invoice_cache.py
+# ذاكرة مؤقتة للفواتير بعنوان المحتوى: بصمة الفاتورة → (بايتات PDF، file_id من تيليجرام).
+# التكرار لنفس الفاتورة يعيد إرسال file_id مباشرة بلا توليد ولا رفع.
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class CachedInvoice:
+    pdf: Optional[bytes] = None
+    file_id: Optional[str] = None
+
+
+class InvoiceCache:
+    """LRU محدود بعدد العناصر وبمجموع حجم ملفات PDF."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entries: int = 2048):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, CachedInvoice]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedInvoice]:
+        entry = self._items.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put_pdf(self, key: str, pdf: bytes) -> None:
+        entry = self._items.get(key)
+        if entry is None:
+            entry = self._items[key] = CachedInvoice()
+        else:
+            self._items.move_to_end(key)
+        if entry.pdf is not None:
+            self._bytes -= len(entry.pdf)
+        entry.pdf = pdf
+        self._bytes += len(pdf)
+        self._evict()
+
+    def set_file_id(self, key: str, file_id: Optional[str]) -> None:
+        entry = self._items.get(key)
+        if entry is not None:
+            entry.file_id = file_id
+
+    def _evict(self) -> None:
+        while self._items and (self._bytes > self.max_bytes or len(self._items) > self.max_entries):
+            _, old = self._items.popitem(last=False)
+            if old.pdf is not None:
+                self._bytes -= len(old.pdf)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,272 @@
+# services/journal.py
+# سجل إلحاقي (append-only) بصيغة JSONL: الإضافة فورية في الذاكرة، والكتابة على القرص
+# دفعات من مهمة خلفية مع fsync دوري، وتدوير الملف عند تجاوز حجمه، وفهرس إزاحات
+# (segment, offset) لكل حقل مفهرس (تاريخ/هاتف) للبحث دون قراءة السجل كاملًا.
+# عدة عمليات (عمّال uvicorn) تكتب لنفس الملفات: كل دفعة تُلحق تحت FileLock من النهاية الفعلية
+# للملف، وكل عملية تقرأ ما أضافه غيرها من ذيل ملف الفهرس قبل الكتابة والبحث.
+import os
+import re
+import json
+import time
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from services.fileio import FileLock
+
+Pos = Tuple[int, int]  # (رقم الملف، الإزاحة داخله)
+
+
+class JsonlJournal:
+    def __init__(self, path: str, *, index_fields: Sequence[str] = ("date", "phone"),
+                 batch_size: int = 100, flush_interval: float = 1.0,
+                 fsync_interval: float = 5.0, max_bytes: int = 10 * 1024 * 1024):
+        root, ext = os.path.splitext(path)
+        self._root = root
+        self._ext = ext or ".jsonl"
+        self.index_path = root + ".idx"
+        self._file_lock = FileLock(root + ".lock")  # دفعة واحدة على القرص بين كل العمليات
+        self.index_fields = tuple(index_fields)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self._index: Dict[Tuple[str, str], List[Pos]] = defaultdict(list)
+        self._buffer: List[Dict[str, Any]] = []
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()  # دفعة واحدة على القرص في كل مرة
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._seg = 0
+        self._f = None
+        self._idx_f = None
+        self._idx_pos = 0  # ما قرأناه من ملف الفهرس (بايت)؛ ما بعده كتبته عمليات أخرى
+        self._last_fsync = 0.0
+        self._dirty = False
+        self.written = 0
+
+    # ---------- الملفات ----------
+    def segment_path(self, seg: int) -> str:
+        return f"{self._root}.{seg:06d}{self._ext}"
+
+    def _segments(self) -> List[int]:
+        folder = os.path.dirname(self._root) or "."
+        name = re.escape(os.path.basename(self._root))
+        pattern = re.compile(rf"^{name}\.(\d{{6}}){re.escape(self._ext)}$")
+        if not os.path.isdir(folder):
+            return []
+        return sorted(int(m.group(1)) for f in os.listdir(folder) if (m := pattern.match(f)))
+
+    def _keys(self, record: Dict[str, Any]) -> List[str]:
+        return [str(record.get(f) or "").replace("\t", " ").replace("\n", " ") for f in self.index_fields]
+
+    def _add_to_index(self, pos: Pos, keys: List[str]) -> None:
+        for field, key in zip(self.index_fields, keys):
+            if key:
+                self._index[(field, key)].append(pos)
+
+    def _parse_index(self, data: bytes) -> List[Tuple[Pos, List[str]]]:
+        entries = []
+        for line in data.decode("utf-8", "replace").split("\n"):
+            parts = line.split("\t")
+            if len(parts) != 2 + len(self.index_fields):
+                continue
+            try:
+                pos = (int(parts[0]), int(parts[1]))
+            except ValueError:
+                continue
+            entries.append((pos, parts[2:]))
+        return entries
+
+    def _tail_index(self) -> List[Tuple[Pos, List[str]]]:
+        """أسطر الفهرس الكاملة المضافة بعد آخر قراءة (من عمليات أخرى)."""
+        try:
+            with open(self.index_path, "rb") as f:
+                f.seek(self._idx_pos)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b"\n") + 1  # سطر بلا نهاية = كتابة لم تكتمل بعد
+        self._idx_pos += end
+        return self._parse_index(data[:end])
+
+    def _open(self) -> None:
+        """تحميل الفهرس، وفهرسة ما كُتب بعده قبل انقطاع (إن وُجد)، ثم فتح آخر ملف للإلحاق."""
+        os.makedirs(os.path.dirname(self._root) or ".", exist_ok=True)
+        self._file_lock.acquire(blocking=True)
+        try:
+            indexed: Dict[int, int] = {}  # seg → إزاحة آخر سطر مفهرس
+            self._idx_pos = 0
+            for pos, keys in self._tail_index():
+                self._add_to_index(pos, keys)
+                indexed[pos[0]] = max(indexed.get(pos[0], -1), pos[1])
+            self._idx_f = open(self.index_path, "ab")
+            if self._idx_f.seek(0, os.SEEK_END) > self._idx_pos:
+                self._idx_f.truncate(self._idx_pos)  # سطر ناقص من آخر كتابة (لا أحد يكتب الآن)
+            segments = self._segments()
+            self._seg = segments[-1] if segments else 1
+            path = self.segment_path(self._seg)
+            if os.path.exists(path):
+                self._recover(path, indexed.get(self._seg, -1))
+            self._f = open(path, "ab")
+            self._idx_pos = self._idx_f.seek(0, os.SEEK_END)
+        finally:
+            self._file_lock.release()
+
+    def _recover(self, path: str, last_indexed: int) -> None:
+        with open(path, "rb+") as f:
+            offset = 0
+            if last_indexed >= 0:
+                f.seek(last_indexed)
+                f.readline()  # السطر المفهرس نفسه
+                offset = f.tell()
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    f.truncate(offset)  # سطر نصف مكتوب
+                    break
+                try:
+                    keys = self._keys(json.loads(line))
+                except ValueError:
+                    offset += len(line)
+                    continue
+                self._add_to_index((self._seg, offset), keys)
+                self._idx_f.write(("\t".join([str(self._seg), str(offset)] + keys) + "\n").encode("utf-8"))
+                offset += len(line)
+        self._idx_f.flush()
+
+    # ---------- الكتابة ----------
+    def append(self, record: Dict[str, Any]) -> None:
+        """إضافة سجل دون انتظار القرص؛ يُكتب مع الدفعة التالية."""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def _sync_segment(self) -> None:
+        """عملية أخرى ربما ألحقت بالملف أو دوّرته: آخر ملف، والكتابة من نهايته الفعلية لا من tell() المحلي."""
+        segments = self._segments()
+        if segments and segments[-1] > self._seg:
+            self._f.close()
+            self._seg = segments[-1]
+            self._f = open(self.segment_path(self._seg), "ab")
+        size = self._f.seek(0, os.SEEK_END)
+        if size:
+            with open(self.segment_path(self._seg), "rb") as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    self._f.write(b"\n")  # سطر ناقص من عملية انقطعت: يبقى سطرًا تالفًا غير مفهرس
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> Tuple[List[Tuple[Pos, List[str]]], List[Tuple[Pos, List[str]]]]:
+        """يعيد (إدخالات عمليات أخرى لم نقرأها بعد، إدخالات هذه الدفعة)."""
+        entries = []
+        self._file_lock.acquire(blocking=True)
+        try:
+            others = self._tail_index()
+            self._sync_segment()
+            for record in batch:
+                if self._f.tell() >= self.max_bytes:
+                    self._rotate()
+                line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                pos = (self._seg, self._f.tell())
+                self._f.write(line)
+                entries.append((pos, self._keys(record)))
+            self._f.flush()
+            # الفهرس يُكتب بعد السجل: إن انقطع التشغيل بينهما يعيد _recover بناء الناقص
+            self._idx_f.write("".join("\t".join([str(p[0]), str(p[1])] + k) + "\n" for p, k in entries).encode("utf-8"))
+            self._idx_f.flush()
+            self._idx_pos = self._idx_f.seek(0, os.SEEK_END)  # لا tell(): قد يكون متأخرًا عن إلحاقات الآخرين
+        finally:
+            self._file_lock.release()
+        self._dirty = True
+        if time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+        return others, entries
+
+    def _fsync(self) -> None:
+        if self._dirty:
+            os.fsync(self._f.fileno())
+            os.fsync(self._idx_f.fileno())
+            self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def _rotate(self) -> None:
+        self._fsync()
+        self._f.close()
+        self._seg += 1
+        self._f = open(self.segment_path(self._seg), "ab")
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            others, entries = await asyncio.to_thread(self._write_batch, batch)
+            for pos, keys in others + entries:
+                self._add_to_index(pos, keys)
+            self.written += len(entries)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+                if self._dirty and time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    async with self._lock:
+                        await asyncio.to_thread(self._fsync)
+            except Exception as e:
+                print(f"⚠️ journal: فشل الكتابة: {e}")
+
+    async def start(self) -> None:
+        if self._task is None:
+            await asyncio.to_thread(self._open)
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """كتابة ما تبقى ثم fsync وإغلاق (لا نلغي المهمة وسط كتابة على القرص)."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close)
+
+    def _close(self) -> None:
+        self._fsync()
+        self._f.close()
+        self._idx_f.close()
+
+    # ---------- البحث ----------
+    def _read(self, positions: List[Pos]) -> List[Dict[str, Any]]:
+        records = []
+        handles: Dict[int, Any] = {}
+        try:
+            for seg, offset in positions:
+                f = handles.get(seg)
+                if f is None:
+                    f = handles[seg] = open(self.segment_path(seg), "rb")
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    async def find(self, field: str, value: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """أحدث `limit` سجلات تطابق field=value (يشمل ما لم يُكتب بعد في الذاكرة)."""
+        if self._idx_f is not None:
+            async with self._lock:  # ما ألحقته العمليات الأخرى منذ آخر دفعة
+                for pos, keys in await asyncio.to_thread(self._tail_index):
+                    self._add_to_index(pos, keys)
+        pending = [r for r in self._buffer if str(r.get(field) or "") == value]
+        positions = self._index.get((field, value), [])[-limit:]
+        records = await asyncio.to_thread(self._read, positions) if positions else []
+        return (records + pending)[-limit:]
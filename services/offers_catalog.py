@@ -0,0 +1,86 @@
+# services/offers_catalog.py
+# كتالوج العروض في الذاكرة: يُحمَّل مرة واحدة ويُعاد تحميله فقط عند تغيّر الملف (mtime)
+# أو عند طلب صريح بعد الأرشفة. النصوص والأزرار محسوبة مسبقًا لكل فهرس،
+# وتُعاد صياغتها إذا تغيّرت قيمة stamp() (مثل إصدار كتالوج الأسعار).
+import os
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# render(idx, code, total) → (caption, reply_markup)
+Renderer = Callable[[int, str, int], Tuple[str, Any]]
+
+
+class OffersCatalog:
+    def __init__(self, path: str, render: Renderer, check_interval: float = 30.0,
+                 stamp: Optional[Callable[[], Any]] = None):
+        self.path = path
+        self.render = render
+        self.check_interval = check_interval
+        self.stamp = stamp
+        self._stamp: Any = None
+        self.items: List[Tuple[str, str]] = []   # (code, file_id) مرتبة حسب الكود
+        self.index: Dict[str, int] = {}          # code → موضعه في items
+        self.captions: List[str] = []
+        self.markups: List[Any] = []
+        self.version = 0
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._loaded = False
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def refresh(self) -> "OffersCatalog":
+        """فحص mtime على الأكثر مرة كل check_interval ثانية؛ ما عدا ذلك لا قراءة من القرص."""
+        now = time.monotonic()
+        if self._loaded and now - self._checked < self.check_interval:
+            return self
+        self._checked = now
+        mtime = self._file_mtime()
+        if not self._loaded or mtime != self._mtime:
+            self._load(mtime)
+        elif self.stamp is not None and self.stamp() != self._stamp:
+            self.set_items(dict(self.items))  # نفس العروض، نصوص جديدة
+        return self
+
+    def reload(self) -> "OffersCatalog":
+        """إعادة تحميل فورية (بعد حفظ الخريطة مثلًا)."""
+        self._checked = time.monotonic()
+        self._load(self._file_mtime())
+        return self
+
+    def _load(self, mtime: Optional[float]) -> None:
+        data: Dict[str, str] = {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"⚠️ offers catalog: تعذّر قراءة {self.path}: {e}")
+                if self._loaded:
+                    return  # نُبقي النسخة السابقة بدل إفراغ الكتالوج
+        self._mtime = mtime
+        self._loaded = True
+        self.set_items(data)
+
+    def set_items(self, data: Dict[str, str]) -> None:
+        if self.stamp is not None:
+            self._stamp = self.stamp()
+        items = sorted(data.items(), key=lambda kv: kv[0])
+        total = len(items)
+        rendered = [self.render(i, code, total) for i, (code, _) in enumerate(items)]
+        self.items = items
+        self.index = {code: i for i, (code, _) in enumerate(items)}
+        self.captions = [r[0] for r in rendered]
+        self.markups = [r[1] for r in rendered]
+        self.version += 1
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def as_map(self) -> Dict[str, str]:
+        return dict(self.items)
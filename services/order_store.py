@@ -0,0 +1,169 @@
+# services/order_store.py
+# مخزن طلبات العملاء للتتبّع: جدول SQLite مفهرس على رقم الطلب + ذاكرة LRU للأرقام الساخنة.
+# الرقم يُطبَّع قبل البحث (أرقام عربية، مسافات، شرطات، حروف صغيرة) فـ "eb ٢٥١٠ ١" = EB-2510-001.
+import csv
+import io
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from services.sqlite_util import connect
+
+ORDER_FIELDS = ("status", "eta", "note")
+
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_SEPARATORS = re.compile(r"[\s\-_‐‑‒–—―−ـ/.]+")
+_CODE_RE = re.compile(r"^(?:EB)?-?(\d{4})-?(\d{1,3})$")
+_ORDER_CODE = re.compile(r"^EB-\d{4}-\d{3}$")
+
+
+def normalize_order_code(text: str) -> str:
+    """صيغة موحّدة EB-YYMM-### إن أمكن، وإلا النص بعد التنظيف (حروف كبيرة بلا مسافات)."""
+    raw = (text or "").translate(_DIGITS).strip().upper()
+    compact = _SEPARATORS.sub("-", raw).strip("-")
+    m = _CODE_RE.match(compact)
+    if m:
+        return f"EB-{m.group(1)}-{int(m.group(2)):03d}"
+    return compact
+
+
+def is_order_code(code: str) -> bool:
+    """رقم مطبَّع بالصيغة EB-YYMM-###."""
+    return _ORDER_CODE.match(code) is not None
+
+
+class OrderStore:
+    def __init__(self, path: str, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._db = connect(path)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "code TEXT PRIMARY KEY, status TEXT NOT NULL, eta TEXT NOT NULL DEFAULT '-', "
+            "note TEXT NOT NULL DEFAULT '', updated_at REAL NOT NULL)"
+        )
+        # code → order أو None (نخزّن عدم الوجود أيضًا حتى لا يضرب التخمين المتكرر القاعدة)
+        self._cache: "OrderedDict[str, Optional[Dict[str, str]]]" = OrderedDict()
+        self._data_version = self._version()
+
+    def _version(self) -> int:
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    # ---------- القراءة ----------
+    def get(self, code: str) -> Optional[Dict[str, str]]:
+        key = normalize_order_code(code)
+        with self._lock:
+            # data_version يتغير عند كتابة اتصال آخر (استيراد من عملية أخرى مثلًا)
+            version = self._version()
+            if version != self._data_version:
+                self._data_version = version
+                self._cache.clear()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                order = self._cache[key]
+            else:
+                row = self._db.execute(
+                    "SELECT code, status, eta, note FROM orders WHERE code = ?", (key,)
+                ).fetchone()
+                order = dict(zip(("code",) + ORDER_FIELDS, row)) if row else None
+                self._remember(key, order)
+        return dict(order) if order else None
+
+    def _remember(self, key: str, order: Optional[Dict[str, str]]) -> None:
+        self._cache[key] = order
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    # ---------- الكتابة ----------
+    @staticmethod
+    def _row(order: Mapping[str, Any], now: float) -> Tuple[str, str, str, str, float]:
+        code = normalize_order_code(str(order.get("code", "")))
+        status = str(order.get("status") or "").strip()
+        if not code or not status:
+            raise ValueError("code و status مطلوبان")
+        eta = str(order.get("eta") or "-").strip()
+        note = str(order.get("note") or "").strip()
+        return code, status, eta, note, now
+
+    def upsert_many(self, orders: Iterable[Mapping[str, Any]]) -> int:
+        """إدخال/تحديث دفعة في معاملة واحدة؛ يعيد عدد الطلبات المكتوبة."""
+        now = time.time()
+        rows = [self._row(o, now) for o in orders]
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO orders (code, status, eta, note, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(code) DO UPDATE SET status = excluded.status, eta = excluded.eta, "
+                    "note = excluded.note, updated_at = excluded.updated_at",
+                    rows,
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            for code, status, eta, note, _ in rows:
+                if code in self._cache:
+                    self._cache[code] = {"code": code, "status": status, "eta": eta, "note": note}
+                    self._cache.move_to_end(code)
+        return len(rows)
+
+    def upsert(self, code: str, status: str, eta: str = "-", note: str = "") -> str:
+        self.upsert_many([{"code": code, "status": status, "eta": eta, "note": note}])
+        return normalize_order_code(code)
+
+    def seed(self, orders: Mapping[str, Mapping[str, Any]]) -> int:
+        """تعبئة أولية من قاموس ثابت — فقط إذا كان الجدول فارغًا."""
+        if self.count():
+            return 0
+        return self.upsert_many({**o, "code": code} for code, o in orders.items())
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# ---------- الاستيراد الجماعي ----------
+def parse_orders(text: str, fmt: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """تحليل CSV (بترويسة code,status,eta,note) أو JSONL (كائن لكل سطر).
+    يعيد (الطلبات الصالحة، أخطاء مع رقم السطر). الرقم يُطبَّع هنا ويُرفض ما ليس EB-YYMM-###،
+    فلا يُسقط سطر واحد الدفعة كلها عند الكتابة."""
+    orders: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text.lstrip("﻿")))
+        rows = ((reader.line_num, row) for row in reader)
+    else:
+        def jsonl():
+            for n, line in enumerate(text.splitlines(), 1):
+                if line.strip():
+                    try:
+                        yield n, json.loads(line)
+                    except ValueError as e:
+                        errors.append(f"سطر {n}: JSON غير صالح ({e})")
+        rows = jsonl()
+    for n, row in rows:
+        if not isinstance(row, dict):
+            errors.append(f"سطر {n}: ليس كائنًا")
+            continue
+        row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+        if not row.get("code") or not str(row.get("status") or "").strip():
+            errors.append(f"سطر {n}: code و status مطلوبان")
+            continue
+        code = normalize_order_code(str(row["code"]))
+        if not is_order_code(code):
+            errors.append(f"سطر {n}: رقم طلب غير صالح ({row['code']})، الصيغة EB-YYMM-###")
+            continue
+        row["code"] = code
+        orders.append(row)
+    return orders, errors
@@ -0,0 +1,62 @@
+# services/polling.py
+# وضع polling بمعالجة متوازية: حلقة getUpdates واحدة تضع التحديثات في UpdateQueue
+# (طابور تسلسلي لكل محادثة + عدد محدود من العمّال)، فلا يوقف تحديث بطيء (PDF، /index_60)
+# بقية المحادثات، ويبقى الترتيب محفوظًا داخل كل محادثة.
+# عند امتلاء الطابور تتوقف القراءة من تيليجرام (put تنتظر) بدل تكديس التحديثات في الذاكرة.
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramUnauthorizedError
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from services.update_queue import UpdateHandler, UpdateQueue
+
+BACKOFF = BackoffConfig(min_delay=1.0, max_delay=30.0, factor=1.5, jitter=0.1)
+
+
+def make_update_handler(dp: Dispatcher, bot: Bot) -> UpdateHandler:
+    """معالجة تحديث خارج رد HTTP: الطلب الذي يعيده الهاندلر يُنفَّذ مباشرة."""
+    async def handle(update: Update) -> None:
+        result = await dp.feed_update(bot, update)
+        if isinstance(result, TelegramMethod):
+            await dp.silent_call_request(bot=bot, result=result)
+    return handle
+
+
+async def poll_into(bot: Bot, queue: UpdateQueue, *, timeout: int = 30,
+                    allowed_updates: Optional[List[str]] = None) -> None:
+    """قراءة getUpdates بلا نهاية مع إعادة المحاولة المتدرجة عند أخطاء الشبكة."""
+    backoff = Backoff(config=BACKOFF)
+    offset: Optional[int] = None
+    kwargs = {}
+    if bot.session.timeout:
+        # الطلب الطويل يجب أن ينتظر أكثر من مهلة polling نفسها
+        kwargs["request_timeout"] = int(bot.session.timeout + timeout)
+    while True:
+        try:
+            updates = await bot(GetUpdates(offset=offset, timeout=timeout, allowed_updates=allowed_updates), **kwargs)
+        except TelegramUnauthorizedError:
+            raise
+        except Exception as e:
+            print(f"⚠️ polling: فشل جلب التحديثات ({type(e).__name__}: {e}) — إعادة بعد {backoff.next_delay:.1f}ث")
+            await backoff.asleep()
+            continue
+        backoff.reset()
+        for update in updates:
+            offset = update.update_id + 1
+            await queue.put(update)
+
+
+async def run_sharded_polling(dp: Dispatcher, bot: Bot, queue: UpdateQueue, *, timeout: int = 30) -> None:
+    """بديل dp.start_polling: نفس خطافات startup/shutdown، والمعالجة عبر الطابور."""
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    await queue.start()
+    try:
+        await poll_into(bot, queue, timeout=timeout, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        # التحديثات المأخوذة من تيليجرام تُكمل معالجتها (حتى مهلة stop) قبل الإغلاق
+        await queue.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
@@ -0,0 +1,65 @@
+# services/prefix_index.py
+# فهرس بادئات في الذاكرة: قائمة مرتبة من (مصطلح، رقم العنصر) يُبحث فيها بـ bisect،
+# فالبحث عن بادئة = نطاق متصل في القائمة — O(log n + عدد النتائج) حتى مع آلاف الأكواد.
+# الاستعلام متعدد الكلمات يعيد تقاطع نتائج كل كلمة (مثل "لامع 6600").
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Set, Tuple
+
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_ARABIC = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ة": "ه", "ى": "ي", "ـ": None})
+_DIACRITICS = re.compile(r"[ً-ْ]")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_term(text: str) -> str:
+    """حروف صغيرة، أرقام لاتينية، توحيد الألف/التاء المربوطة، بلا تشكيل أو فواصل."""
+    text = (text or "").casefold()
+    if not text.isascii():
+        text = _DIACRITICS.sub("", text.translate(_DIGITS).translate(_ARABIC))
+    return text if text.isalnum() else _NON_WORD.sub("", text)
+
+
+def code_terms(code: str) -> List[str]:
+    """الكود كاملًا وجزؤه الرقمي، فيطابق "66000" الكود CG6600017 أيضًا."""
+    full = normalize_term(code)
+    digits = full.lstrip("abcdefghijklmnopqrstuvwxyz")
+    return [full, digits] if digits and digits != full else [full]
+
+
+class PrefixIndex:
+    def __init__(self, entries: Iterable[Tuple[int, Iterable[str]]] = ()):
+        norm: Dict[str, str] = {}  # الوسوم (اللون، اللمعة) تتكرر بين آلاف العناصر
+        pairs = set()
+        for i, terms in entries:
+            for raw in terms:
+                t = norm.get(raw)
+                if t is None:
+                    t = norm[raw] = normalize_term(raw)
+                if t:
+                    pairs.add((t, i))
+        pairs = sorted(pairs)
+        self._terms: List[str] = [t for t, _ in pairs]
+        self._ids: List[int] = [i for _, i in pairs]
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def _prefix(self, token: str) -> Set[int]:
+        lo = bisect_left(self._terms, token)
+        hi = bisect_left(self._terms, token + "\U0010ffff", lo)
+        return set(self._ids[lo:hi])
+
+    def search(self, query: str) -> List[int]:
+        """أرقام العناصر المطابقة لكل كلمات الاستعلام (كبادئات)، مرتبة تصاعديًا."""
+        tokens = [t for t in (normalize_term(w) for w in (query or "").split()) if t]
+        if not tokens:
+            return []
+        # الكلمة الأطول أضيق نطاقًا: نبدأ بها ثم نقاطع الباقي
+        tokens.sort(key=len, reverse=True)
+        found = self._prefix(tokens[0])
+        for token in tokens[1:]:
+            if not found:
+                break
+            found &= self._prefix(token)
+        return sorted(found)
@@ -0,0 +1,107 @@
+# services/price_catalog.py
+# كتالوج الأصناف والأسعار (products.json): يُحمَّل مرة واحدة إلى قواميس في الذاكرة
+# ويُعاد تحميله تلقائيًا عند تغيّر الملف، فتعديل الأسعار لا يحتاج إعادة تشغيل.
+#
+# الشكل:
+# {"defaults": {"wall": 29, "floor": 29, "decor": 20, "strip": 10},
+#  "products": {"CG6600001": {"name": "...", "unit": "م²", "price": 29,
+#                              "tags": ["لامع", "أبيض"]}}}   ← tags اختيارية (للبحث: اللمعة، اللون...)
+import os
+import json
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from services.quote_engine import DEFAULT_PRICES, Prices
+
+PRODUCTS_JSON = os.getenv("PRODUCTS_JSON", "products.json")
+PRICES_RELOAD_INTERVAL = float(os.getenv("PRICES_RELOAD_INTERVAL", "30"))  # ثوانٍ بين فحوص mtime
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    code: str
+    name: str
+    unit: str
+    price: float
+    tags: Tuple[str, ...] = ()
+
+
+def normalize_code(code: str) -> str:
+    return (code or "").strip().upper()
+
+
+class PriceCatalog:
+    def __init__(self, path: str, check_interval: float = 30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.defaults: Prices = DEFAULT_PRICES
+        self.products: Dict[str, Product] = {}
+        self.version = 0
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._loaded = False
+
+    def refresh(self) -> "PriceCatalog":
+        """فحص mtime على الأكثر مرة كل check_interval ثانية."""
+        now = time.monotonic()
+        if self._loaded and now - self._checked < self.check_interval:
+            return self
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if not self._loaded or mtime != self._mtime:
+            self._load(mtime)
+        return self
+
+    def reload(self) -> "PriceCatalog":
+        self._loaded = False
+        return self.refresh()
+
+    def _load(self, mtime: Optional[float]) -> None:
+        defaults, products = DEFAULT_PRICES, {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                d = raw.get("defaults", {})
+                defaults = Prices(
+                    wall=float(d.get("wall", DEFAULT_PRICES.wall)),
+                    floor=float(d.get("floor", DEFAULT_PRICES.floor)),
+                    decor=float(d.get("decor", DEFAULT_PRICES.decor)),
+                    strip=float(d.get("strip", DEFAULT_PRICES.strip)),
+                )
+                for code, p in raw.get("products", {}).items():
+                    code = normalize_code(code)
+                    products[code] = Product(
+                        code=code,
+                        name=str(p.get("name", "")),
+                        unit=str(p.get("unit", "م²")),
+                        price=float(p["price"]),
+                        tags=tuple(str(t) for t in p.get("tags", ())),
+                    )
+            except Exception as e:
+                print(f"⚠️ price catalog: تعذّر قراءة {self.path}: {e}")
+                if self._loaded:
+                    return  # نُبقي الأسعار السابقة بدل الرجوع للافتراضية
+                defaults, products = DEFAULT_PRICES, {}
+        self._mtime = mtime
+        self._loaded = True
+        self.defaults = defaults
+        self.products = products
+        self.version += 1
+
+    def get(self, code: str) -> Optional[Product]:
+        return self.refresh().products.get(normalize_code(code))
+
+    def prices(self) -> Prices:
+        return self.refresh().defaults
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+
+# نسخة واحدة للعملية: تستخدمها الحاسبة وعارض العروض وواجهة /api/quote
+price_catalog = PriceCatalog(PRODUCTS_JSON, check_interval=PRICES_RELOAD_INTERVAL)
@@ -0,0 +1,221 @@
+# services/quote_engine.py
+# محرك التسعير: نماذج الفاتورة + حساب المساحات كدوال نقية بلا تيليجرام ولا FSM.
+# تستخدمه حاسبة البوت (غرفة واحدة في كل مرة) وواجهة POST /api/quote (دفعة غرف كاملة).
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# ---------- Pricing Constants ----------
+PRICE_WALL_PER_M2 = 29.0
+PRICE_FLOOR_PER_M2 = 29.0
+PRICE_DECOR_PER_UNIT = 20.0
+PRICE_STRIP_PER_UNIT = 10.0
+
+DEFAULT_HEIGHT_M = 3.2  # for kitchen/bath when using dimensions or area (default)
+DECOR_STEP_M = 0.6      # one decor piece per 60 cm of perimeter, two strips per decor
+MAX_INPUT = 10_000.0    # upper bound for any batch length (m) or area (m²); keeps totals finite
+
+CATEGORIES = ("kitchen", "bath", "floor", "flat")
+NAME_PREFIX = {"kitchen": "مطبخ ", "bath": "حمّام ", "floor": "أرضية ", "flat": "مساحة مسطّحة "}
+
+
+@dataclass(frozen=True, slots=True)
+class Prices:
+    wall: float = PRICE_WALL_PER_M2
+    floor: float = PRICE_FLOOR_PER_M2
+    decor: float = PRICE_DECOR_PER_UNIT
+    strip: float = PRICE_STRIP_PER_UNIT
+
+    def to_tuple(self) -> tuple:
+        return (self.wall, self.floor, self.decor, self.strip)
+
+
+DEFAULT_PRICES = Prices()
+
+
+def ceildiv(a: float, b: float) -> int:
+    return math.ceil(a / b)
+
+
+# ---------- Data Models ----------
+# Slotted, immutable models: no per-instance __dict__, totals computed once at
+# construction, and a flat tuple form for FSM storage.
+@dataclass(frozen=True, slots=True)
+class Line:
+    label: str
+    unit: str
+    qty: float
+    price: float
+    total: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "total", round(self.qty * self.price, 2))
+
+    def to_tuple(self) -> tuple:
+        return (self.label, self.unit, self.qty, self.price)
+
+    @classmethod
+    def from_tuple(cls, t) -> "Line":
+        return cls(*t)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"label": self.label, "unit": self.unit, "qty": self.qty, "price": self.price, "total": self.total}
+
+
+@dataclass(frozen=True, slots=True)
+class SpaceInvoice:
+    name: str
+    category: str  # kitchen|bath|floor|flat
+    perimeter_m: float = 0.0
+    height_m: float = DEFAULT_HEIGHT_M
+    wall_area_m2: float = 0.0
+    floor_area_m2: float = 0.0
+    lines: Tuple[Line, ...] = ()
+    total: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not isinstance(self.lines, tuple):
+            object.__setattr__(self, "lines", tuple(self.lines))
+        object.__setattr__(self, "total", round(sum(l.total for l in self.lines), 2))
+
+    def compute_totals(self) -> float:
+        return self.total
+
+    def to_tuple(self) -> tuple:
+        return (self.name, self.category, self.perimeter_m, self.height_m,
+                self.wall_area_m2, self.floor_area_m2, tuple(l.to_tuple() for l in self.lines))
+
+    @classmethod
+    def from_tuple(cls, t) -> "SpaceInvoice":
+        *head, lines = t
+        return cls(*head, lines=tuple(Line.from_tuple(ln) for ln in lines))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name, "category": self.category,
+            "perimeter_m": self.perimeter_m, "height_m": self.height_m,
+            "wall_area_m2": self.wall_area_m2, "floor_area_m2": self.floor_area_m2,
+            "lines": [l.to_dict() for l in self.lines], "total": self.total,
+        }
+
+
+# ---------- Single-space pricing ----------
+def space_name(kind: str, idx: int) -> str:
+    return NAME_PREFIX[kind] + str(idx)
+
+
+def kb_space(name: str, kind: str, perimeter: float, wall_area: float, floor_area: float,
+             H: float, prices: Prices = DEFAULT_PRICES) -> SpaceInvoice:
+    """مطبخ/حمّام: حائط + أرضية + ديكورات (قطعة لكل 60 سم من المحيط) + استريشات (ضعف الديكورات)."""
+    decor_units = ceildiv(perimeter, DECOR_STEP_M)
+    strip_units = decor_units * 2
+    return SpaceInvoice(
+        name=name, category=kind,
+        perimeter_m=round(perimeter, 2), height_m=H,
+        wall_area_m2=round(wall_area, 2), floor_area_m2=round(floor_area, 2),
+        lines=(
+            Line("حائط", "م²", qty=round(wall_area, 2), price=prices.wall),
+            Line("أرضية", "م²", qty=round(floor_area, 2), price=prices.floor),
+            Line("ديكورات", "قطعة", qty=float(decor_units), price=prices.decor),
+            Line("استريشات", "قطعة", qty=float(strip_units), price=prices.strip),
+        ),
+    )
+
+
+def kb_space_from_dims(name: str, kind: str, L: float, W: float, H: float,
+                       prices: Prices = DEFAULT_PRICES) -> SpaceInvoice:
+    perimeter = 2 * (L + W)
+    return kb_space(name, kind, perimeter, perimeter * H, L * W, H, prices)
+
+
+def kb_space_from_areas(name: str, kind: str, wall_area: float, floor_area: float, H: float,
+                        prices: Prices = DEFAULT_PRICES) -> SpaceInvoice:
+    perimeter = (wall_area / H) if H and H > 0 else 0.0
+    return kb_space(name, kind, perimeter, wall_area, floor_area, H, prices)
+
+
+def ff_space(name: str, kind: str, area: float, prices: Prices = DEFAULT_PRICES,
+             product: Optional[Any] = None) -> SpaceInvoice:
+    """أرضية/مساحة مسطّحة: بند واحد — بسعر الصنف المختار (code/unit/price) أو بسعر متر الأرضية."""
+    if product is not None:
+        line = Line(product.code, product.unit, qty=round(area, 2), price=product.price)
+    else:
+        line = Line("صنف 1", "م²", qty=round(area, 2), price=prices.floor)
+    return SpaceInvoice(
+        name=name, category=kind, wall_area_m2=0.0, floor_area_m2=round(area, 2),
+        lines=(line,),
+    )
+
+
+# ---------- Batch pricing ----------
+class QuoteError(ValueError):
+    """مدخلات غرفة غير صالحة؛ الرسالة تحدد رقم الغرفة والحقل."""
+
+
+def _num(room: Mapping[str, Any], key: str, i: int, *, positive: bool = False,
+         default: Optional[float] = None) -> Optional[float]:
+    value = room.get(key)
+    if value is None:
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise QuoteError(f"rooms[{i}].{key}: يجب أن يكون رقمًا")
+    if not math.isfinite(value) or value < 0 or (positive and value == 0):
+        raise QuoteError(f"rooms[{i}].{key}: قيمة غير صالحة")
+    if value > MAX_INPUT:
+        raise QuoteError(f"rooms[{i}].{key}: الحد الأقصى {MAX_INPUT:g}")
+    return value
+
+
+def quote_rooms(rooms: Iterable[Mapping[str, Any]], prices: Prices = DEFAULT_PRICES,
+                counters: Optional[Dict[str, int]] = None,
+                products: Optional[Callable[[str], Any]] = None) -> List[SpaceInvoice]:
+    """تسعير دفعة غرف في تمريرة واحدة.
+
+    كل غرفة: {"category": kitchen|bath|floor|flat, "name"?: str} مع
+    - مطبخ/حمّام: length + width [+ height] أو wall_area + floor_area [+ height]
+    - أرضية/مسطّح: area أو length + width [+ product: كود الصنف، يُبحث عنه بـ products(code)]
+    الأسماء غير المحددة تُرقّم تلقائيًا لكل نوع كما في البوت."""
+    counters = dict.fromkeys(CATEGORIES, 0) if counters is None else counters
+    spaces: List[SpaceInvoice] = []
+    append = spaces.append
+    for i, room in enumerate(rooms):
+        if not isinstance(room, Mapping):
+            raise QuoteError(f"rooms[{i}]: يجب أن تكون كائن JSON")
+        kind = room.get("category")
+        if kind not in NAME_PREFIX:
+            raise QuoteError(f"rooms[{i}].category: أحد {', '.join(CATEGORIES)}")
+        counters[kind] = counters.get(kind, 0) + 1
+        name = str(room.get("name") or space_name(kind, counters[kind]))
+        L, W = _num(room, "length", i, positive=True), _num(room, "width", i, positive=True)
+        if kind in ("kitchen", "bath"):
+            H = _num(room, "height", i, positive=True, default=DEFAULT_HEIGHT_M)
+            if L is not None and W is not None:
+                append(kb_space_from_dims(name, kind, L, W, H, prices))
+            else:
+                wall = _num(room, "wall_area", i, positive=True)
+                floor = _num(room, "floor_area", i, default=0.0)
+                if wall is None:
+                    raise QuoteError(f"rooms[{i}]: length+width أو wall_area+floor_area مطلوبة")
+                append(kb_space_from_areas(name, kind, wall, floor, H, prices))
+        else:
+            area = L * W if L is not None and W is not None else _num(room, "area", i)
+            if area is None:
+                raise QuoteError(f"rooms[{i}]: area أو length+width مطلوبة")
+            product = None
+            code = room.get("product")
+            if code:
+                product = products(str(code)) if products else None
+                if product is None:
+                    raise QuoteError(f"rooms[{i}].product: صنف غير موجود ({code})")
+            append(ff_space(name, kind, area, prices, product))
+    return spaces
+
+
+def quote_summary(spaces: List[SpaceInvoice]) -> Dict[str, Any]:
+    return {
+        "spaces": [sp.to_dict() for sp in spaces],
+        "count": len(spaces),
+        "grand_total": round(sum(sp.total for sp in spaces), 2),
+    }
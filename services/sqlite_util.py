@@ -0,0 +1,16 @@
+# services/sqlite_util.py
+# فتح قواعد SQLite المحلية بإعدادات مناسبة للمشاركة بين عدة عمّال (WAL).
+import os
+import sqlite3
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """اتصال SQLite بوضع WAL يسمح بقارئين متعددين مع كاتب واحد عبر العمليات."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
@@ -0,0 +1,158 @@
+# services/update_queue.py
+# طابور استقبال التحديثات: الويبهوك يضع التحديث ويرد فورًا، ومجموعة محدودة من العمّال تعالجه.
+# الترتيب محفوظ داخل كل محادثة (طابور تسلسلي لكل chat)، والمحادثات المختلفة تُعالج بالتوازي.
+# يُستخدم أيضًا في وضع polling (services/polling.py) عبر put() التي تنتظر عند الامتلاء.
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from aiogram.types import Update
+
+UpdateHandler = Callable[[Update], Awaitable[object]]
+
+
+def update_chat_key(update: Update) -> int:
+    """مفتاح الترتيب للتحديث: رقم المحادثة، أو المستخدم إن لم توجد محادثة."""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        chat = getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+class UpdateQueue:
+    """طوابير تسلسلية لكل محادثة يسحب منها عدد محدود من العمّال."""
+
+    def __init__(self, handler: UpdateHandler, workers: int = 8, maxsize: int = 1000,
+                 max_per_chat: int = 0):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.max_per_chat = max(0, max_per_chat)  # 0 = بلا حد لكل محادثة
+        self._chats: Dict[int, Deque[Update]] = {}  # محادثة مجدولة أو قيد المعالجة
+        self._ready: "asyncio.Queue[int]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._space = asyncio.Event()  # يُضبط عند وجود مكان في الطابور
+        self._space.set()
+        self.accepted = 0
+        self.shed = 0
+        self.overflow = 0
+        self._overflowing: Set[int] = set()  # محادثات سُجّل تجاوزها (رسالة واحدة لكل محادثة)
+        self.failed = 0
+
+    @property
+    def depth(self) -> int:
+        """عدد التحديثات المنتظرة أو قيد المعالجة."""
+        return self._pending
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self._pending,
+            "maxsize": self.maxsize,
+            "chats": len(self._chats),
+            "workers": self.workers,
+            "accepted": self.accepted,
+            "shed": self.shed,
+            "overflow": self.overflow,
+            "failed": self.failed,
+        }
+
+    def put_nowait(self, update: Update) -> bool:
+        """إضافة تحديث؛ تعيد False (إسقاط الحمل) فقط إذا كان الطابور كله ممتلئًا، فيرد الويبهوك 503
+        ويعيد تيليجرام إرساله لاحقًا. تجاوز محادثة واحدة لـ max_per_chat يُسقط تحديثها هي فقط
+        (مع سطر في السجل) ويعيد True — فلا تؤخر محادثة مُغرِقة إعادة إرسال تحديثات الآخرين."""
+        if self._pending >= self.maxsize:
+            self.shed += 1
+            return False
+        if self._chat_full(update_chat_key(update)):
+            self.overflow += 1
+            return True
+        self._enqueue(update)
+        return True
+
+    async def put(self, update: Update) -> None:
+        """مثل put_nowait لكن تنتظر حتى يتوفر مكان في الطابور بدل الإسقاط: ضغط عكسي على المصدر،
+        فلا يضيع تحديث أُخذ من getUpdates. تجاوز max_per_chat لا يوقف الاستقبال: يُضاف التحديث
+        لمتأخرات محادثته (يفرغها عاملها بالترتيب) ضمن حد maxsize العام."""
+        while self._pending >= self.maxsize:
+            self._space.clear()
+            await self._space.wait()
+        if self._chat_full(update_chat_key(update)):
+            self.overflow += 1
+        self._enqueue(update)
+
+    def _chat_full(self, key: int) -> bool:
+        q = self._chats.get(key)
+        if q is None or not self.max_per_chat or len(q) < self.max_per_chat:
+            return False
+        if key not in self._overflowing:
+            self._overflowing.add(key)
+            print(f"⚠️ update queue: المحادثة {key} تجاوزت {self.max_per_chat} تحديثًا منتظرًا")
+        return True
+
+    def _enqueue(self, update: Update) -> None:
+        key = update_chat_key(update)
+        q = self._chats.get(key)
+        schedule = q is None
+        if schedule:
+            q = self._chats[key] = deque()
+        q.append(update)
+        self._pending += 1
+        self.accepted += 1
+        if self._idle is not None:
+            self._idle.clear()
+        if schedule:
+            self._ready.put_nowait(key)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._idle = asyncio.Event()
+        if not self._pending:
+            self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """انتظار تفريغ الطابور (حتى المهلة) ثم إيقاف العمّال."""
+        if self._idle is not None and self._pending:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ update queue: إيقاف مع {self._pending} تحديث غير معالج")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            key = await self._ready.get()
+            q = self._chats[key]
+            update = q.popleft()
+            try:
+                await self.handler(update)
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ update {update.update_id} (worker {n}): {e}")
+            finally:
+                self._pending -= 1
+                if q:
+                    # المحادثة تعود لآخر الصف حتى لا تحتكر عاملًا
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                    self._overflowing.discard(key)
+                if self._pending < self.maxsize:
+                    self._space.set()
+                if not self._pending and self._idle is not None:
+                    self._idle.set()
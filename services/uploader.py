@@ -0,0 +1,129 @@
+# services/uploader.py
+# رفع الصور بالتوازي مع معدل تكيّفي: يتسارع مع النجاح ويتوقف بالضبط مدة retry_after عند FloodWait.
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import FSInputFile, Message
+
+# (code, path, caption)
+UploadJob = Tuple[str, str, str]
+
+
+class AdaptiveRateLimiter:
+    """دلو رموز (token bucket) بمعدل يزيد تدريجيًا مع النجاح وينصف عند RetryAfter."""
+
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.2, max_rate: float = 10.0,
+                 increase: float = 0.25, burst: float = 3.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.burst = burst
+        self._tokens = 1.0
+        self._stamp = time.monotonic()
+        self._pause_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._pause_until:
+                    await asyncio.sleep(self._pause_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_retry_after(self, seconds: float) -> None:
+        self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = 0.0
+
+
+class ProgressMessage:
+    """رسالة حالة واحدة تُعدَّل بدل إرسال رسالة لكل صورة (بحد أدنى للفاصل بين التعديلات)."""
+
+    def __init__(self, message: Message, interval: float = 2.0):
+        self.message = message
+        self.interval = interval
+        self._last = 0.0
+        self._text = message.text or ""
+
+    async def update(self, text: str, force: bool = False) -> None:
+        now = time.monotonic()
+        if text == self._text or (not force and now - self._last < self.interval):
+            return
+        self._last = now
+        self._text = text
+        try:
+            await self.message.edit_text(text)
+        except TelegramRetryAfter:
+            pass  # نتخطى هذا التحديث؛ التالي سيظهر الحالة الأحدث
+        except TelegramBadRequest:
+            pass
+
+
+async def upload_photos(
+    bot: Bot,
+    chat_id: int,
+    jobs: List[UploadJob],
+    *,
+    concurrency: int = 4,
+    limiter: Optional[AdaptiveRateLimiter] = None,
+    on_progress: Optional[Callable[[int, int, int], Awaitable[None]]] = None,
+    max_retries: int = 5,
+    results: Optional[Dict[str, str]] = None,
+) -> Tuple[Dict[str, str], List[Tuple[str, str]]]:
+    """رفع الصور وإرجاع (code → file_id، قائمة الإخفاقات).
+
+    يمكن تمرير results ليملأه الرافع أثناء العمل (للحفظ الدوري من الخارج)."""
+    limiter = limiter or AdaptiveRateLimiter()
+    results = {} if results is None else results
+    already = len(results)
+    fails: List[Tuple[str, str]] = []
+    queue: "asyncio.Queue[UploadJob]" = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    total = len(jobs)
+
+    async def report() -> None:
+        if on_progress:
+            await on_progress(len(results) - already, len(fails), total)
+
+    async def upload_one(code: str, path: str, caption: str) -> None:
+        for _ in range(max_retries):
+            await limiter.acquire()
+            try:
+                sent = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(path), caption=caption)
+            except TelegramRetryAfter as e:
+                limiter.on_retry_after(e.retry_after)
+                continue
+            except Exception as e:
+                fails.append((code, str(e)))
+                return
+            limiter.on_success()
+            results[code] = sent.photo[-1].file_id
+            return
+        fails.append((code, "تجاوز عدد محاولات FloodWait"))
+
+    async def worker() -> None:
+        while True:
+            try:
+                code, path, caption = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await upload_one(code, path, caption)
+            await report()
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    return results, fails
@@ -2,15 +2,38 @@
 # ✅ يعيد استخدام bot و dp (مع كل الأوامر والراوترات) من bot.py
 
 import os
+import re
+import hmac
+import json
+import base64
+import asyncio
+import hashlib
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
 from aiogram.types import Update
+from aiogram.methods import TelegramMethod
 
 # ⚠️ مهم: bot.py يجب ألا يبدأ polling عند مجرد الاستيراد.
 # (عندك مضبوط داخل if __name__ == "__main__": asyncio.run(main()))
 from bot import bot, dp  # يعيد استخدام جميع الهاندلرز/الراوترات المضافة في bot.py
+from services.update_queue import UpdateQueue
+from services.polling import make_update_handler
+from services.dedup import make_seen_updates
+from services.quote_engine import QuoteError, quote_rooms, quote_summary
+from services.price_catalog import price_catalog
+from handlers.tile_calculator import render_pdf
 
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "super-secret")
+# رمز الترويسة X-Telegram-Bot-Api-Secret-Token يقبل فقط A-Z a-z 0-9 _ -
+if re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+    SECRET_TOKEN = WEBHOOK_SECRET
+else:
+    SECRET_TOKEN = hashlib.sha256(WEBHOOK_SECRET.encode()).hexdigest()
+_SECRET_TOKEN_BYTES = SECRET_TOKEN.encode()
+# أقصى حجم لجسم التحديث (تحديثات تيليجرام أصغر من ذلك بكثير)
+WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", str(256 * 1024)))
 
 # على Render نقرأ WEBHOOK_DOMAIN (اسم الدومين العام للتطبيق)
 DOMAIN = os.getenv("WEBHOOK_DOMAIN")
@@ -25,31 +48,173 @@ BASE_URL = f"https://{DOMAIN}".rstrip("/")
 WEBHOOK_PATH = f"/webhook/{WEBHOOK_SECRET}"
 WEBHOOK_URL = BASE_URL + WEBHOOK_PATH
 
+# وضع المعالجة: inline (ينتظر الهاندلر قبل الرد) أو queue (يضع التحديث في طابور ويرد فورًا)
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "inline").strip().lower()
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_MAX_PER_CHAT = int(os.getenv("UPDATE_MAX_PER_CHAT", "50"))  # حد طابور المحادثة الواحدة
+# إرسال رد الهاندلر داخل رد الويبهوك (يوفّر طلب HTTPS صادر لكل تحديث)
+WEBHOOK_REPLY_IN_RESPONSE = os.getenv("WEBHOOK_REPLY_IN_RESPONSE", "1") != "0"
+
+# واجهة التسعير للموقع وفريق المبيعات (POST /api/quote)
+# بدون مفتاح تبقى الواجهة عامة لكن محدودة: دفعات صغيرة وبدون PDF (مجمّع PDF يخدم /export للعملاء)
+QUOTE_API_KEY = os.getenv("QUOTE_API_KEY", "")
+QUOTE_MAX_BODY = int(os.getenv("QUOTE_MAX_BODY", str(2 * 1024 * 1024)))
+QUOTE_MAX_ROOMS = int(os.getenv("QUOTE_MAX_ROOMS", "10000"))
+QUOTE_PUBLIC_MAX_ROOMS = int(os.getenv("QUOTE_PUBLIC_MAX_ROOMS", "20"))
+QUOTE_PDF_MAX_ROOMS = int(os.getenv("QUOTE_PDF_MAX_ROOMS", "200"))
+
+# في وضع الطابور لا يوجد رد HTTP ننتظره، فننفّذ الطلب المُرجَع مباشرة
+process_update = make_update_handler(dp, bot)
+
+def webhook_reply(method: TelegramMethod):
+    """تحويل طلب تيليجرام إلى جسم رد الويبهوك (JSON)، أو None إذا احتوى ملفات للرفع."""
+    files = {}
+    payload = {"method": method.__api_method__}
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files=files, _dumps_json=False)
+        if value is not None:
+            payload[key] = value
+    return None if files else payload
+
+update_queue = UpdateQueue(process_update, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE,
+                           max_per_chat=UPDATE_MAX_PER_CHAT)
+# نافذة update_id لإسقاط إعادة الإرسال من تيليجرام عندما يتأخر الرد (DEDUP_BACKEND)
+seen_updates = make_seen_updates()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # نفس خطافات dp.startup/dp.shutdown التي يشغّلها polling (السجل، الملخّصات...)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    if WEBHOOK_MODE == "queue":
+        await update_queue.start()
     # ربط الويبهوك (مع حذف القديم)
     try:
         await bot.delete_webhook(drop_pending_updates=True)
     except Exception as e:
         print(f"⚠️ delete_webhook: {e}")
-    await bot.set_webhook(WEBHOOK_URL)
+    await bot.set_webhook(WEBHOOK_URL, secret_token=SECRET_TOKEN)
     print(f"✅ Webhook set to: {WEBHOOK_URL}")
     yield
     try:
         await bot.delete_webhook(drop_pending_updates=False)
     except Exception:
         pass
+    if WEBHOOK_MODE == "queue":
+        await update_queue.stop()
+    try:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    finally:
+        # إغلاق صريح للتخزين وجلسة HTTP حتى لو فشل أحد خطافات الإيقاف
+        # (close في SQLiteStorage آمن للتكرار مع خطاف aiogram الافتراضي)
+        await dp.storage.close()
+        await bot.session.close()
 
 app = FastAPI(title="EamarBiyoutBot Webhook", lifespan=lifespan)
 
 @app.get("/")
 async def root():
-    return {"status": "ok", "webhook": WEBHOOK_URL}
+    info = {"status": "ok", "webhook": WEBHOOK_URL, "mode": WEBHOOK_MODE}
+    if WEBHOOK_MODE == "queue":
+        info["queue"] = update_queue.stats()
+    return info
+
+async def read_body_capped(request: Request, limit: int):
+    """قراءة الجسم مع التوقف فور تجاوز الحد؛ تعيد None إذا كان أكبر من المسموح."""
+    declared = request.headers.get("content-length")
+    if declared and (not declared.isdigit() or int(declared) > limit):
+        return None
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 # ✅ هذا هو مسار استقبال التحديثات وتمريرها لنفس dp الخاص بكامل أوامرك
 @app.post(WEBHOOK_PATH)
 async def telegram_update(request: Request):
-    data = await request.json()
-    update = Update.model_validate(data)  # Aiogram v3 (Pydantic v2)
-    await dp.feed_update(bot, update)
+    # رفض مبكر قبل قراءة الجسم: مقارنة ثابتة الزمن لرمز تيليجرام السري
+    token = request.headers.get("x-telegram-bot-api-secret-token", "").encode()
+    if not hmac.compare_digest(token, _SECRET_TOKEN_BYTES):
+        return JSONResponse({"ok": False}, status_code=401)
+    body = await read_body_capped(request, WEBHOOK_MAX_BODY)
+    if body is None:
+        return JSONResponse({"ok": False}, status_code=413)
+    try:
+        # تحليل JSON والتحقق في خطوة واحدة داخل pydantic-core، مع ربط التحديث بالبوت
+        # مباشرة (وإلا يعيد feed_update بناءه كاملًا عبر model_dump/model_validate)
+        update = Update.model_validate_json(body, context={"bot": bot})
+    except ValidationError:
+        return JSONResponse({"ok": False}, status_code=400)
+    if seen_updates is not None and seen_updates.seen(update.update_id):
+        return {"ok": True}  # إعادة إرسال لتحديث استُلم سابقًا
+    if WEBHOOK_MODE == "queue":
+        # الطابور ممتلئ: 503 تجعل تيليجرام يعيد الإرسال لاحقًا بدل فقدان التحديث
+        # (تجاوز محادثة واحدة لحدها يُسقط تحديثها فقط داخل put_nowait ولا يوقف الباقين)
+        if not update_queue.put_nowait(update):
+            if seen_updates is not None:
+                seen_updates.forget(update.update_id)
+            return JSONResponse({"ok": False, "error": "busy"}, status_code=503)
+        return {"ok": True}
+    try:
+        if not WEBHOOK_REPLY_IN_RESPONSE:
+            await process_update(update)
+            return {"ok": True}
+        result = await dp.feed_webhook_update(bot, update)
+    except Exception:
+        # فشل المعالجة: نسمح لإعادة الإرسال بالمرور
+        if seen_updates is not None:
+            seen_updates.forget(update.update_id)
+        raise
+    if isinstance(result, TelegramMethod):
+        payload = webhook_reply(result)
+        if payload is not None:
+            return payload
+        # رفع ملفات لا يصلح داخل رد JSON → طلب API عادي
+        await dp.silent_call_request(bot=bot, result=result)
     return {"ok": True}
+
+# ✅ تسعير دفعة غرف كاملة بدون المرور بمحادثة تيليجرام
+@app.post("/api/quote")
+async def api_quote(request: Request):
+    authenticated = False
+    if QUOTE_API_KEY:
+        key = request.headers.get("x-api-key", "").encode()
+        if not hmac.compare_digest(key, QUOTE_API_KEY.encode()):
+            return JSONResponse({"ok": False, "error": "unauthorized"}, status_code=401)
+        authenticated = True
+    max_rooms = QUOTE_MAX_ROOMS if authenticated else QUOTE_PUBLIC_MAX_ROOMS
+    body = await read_body_capped(request, QUOTE_MAX_BODY if authenticated else 64 * 1024)
+    if body is None:
+        return JSONResponse({"ok": False, "error": "body too large"}, status_code=413)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return JSONResponse({"ok": False, "error": "invalid JSON"}, status_code=400)
+    rooms = payload.get("rooms") if isinstance(payload, dict) else None
+    if not isinstance(rooms, list) or not rooms:
+        return JSONResponse({"ok": False, "error": "rooms: قائمة غير فارغة مطلوبة"}, status_code=400)
+    if len(rooms) > max_rooms:
+        return JSONResponse({"ok": False, "error": f"الحد الأقصى {max_rooms} غرفة"}, status_code=413)
+    if payload.get("pdf") and not authenticated:
+        return JSONResponse({"ok": False, "error": "PDF يتطلب QUOTE_API_KEY"}, status_code=403)
+    try:
+        # الدفعات الكبيرة تُحسب خارج حلقة الأحداث حتى لا تتأخر تحديثات تيليجرام
+        spaces = await asyncio.to_thread(
+            quote_rooms, rooms, price_catalog.prices(), products=price_catalog.get
+        )
+    except QuoteError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    result = {"ok": True, **quote_summary(spaces)}
+    if payload.get("pdf"):
+        if len(spaces) > QUOTE_PDF_MAX_ROOMS:
+            return JSONResponse({"ok": False, "error": f"PDF حتى {QUOTE_PDF_MAX_ROOMS} غرفة فقط"}, status_code=400)
+        try:
+            pdf = await render_pdf(spaces)
+        except asyncio.TimeoutError:
+            return JSONResponse({"ok": False, "error": "pdf timeout"}, status_code=504)
+        result["pdf_base64"] = base64.b64encode(pdf).decode("ascii")
+    # JSONResponse مباشرة: النتيجة أنواع JSON أصلًا، فلا داعي لمرور jsonable_encoder عليها
+    return JSONResponse(result)